@@ -0,0 +1,167 @@
+# This module generates big synthetic histories and measures performance of the tracker.
+# Run: python benchmark.py [name ...], names are keys of BENCHMARKS (all by default).
+
+from __future__ import annotations
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Any, Callable, Iterable
+from tabulate import tabulate
+from tracker_classes import Habit, CheckOff, HabitManager, CheckOffManager
+import analytics
+import fsck
+from scheduler import DueScheduler
+
+
+def make_habits(habits_number: int, today: date, days: int) -> list[Habit]:
+    ''' List of habits sorted as HabitManager stores them, every third habit is weekly. '''
+    start = today - timedelta(days=days)
+    habits = [Habit(f"Habit {index:05}", f"Description of habit {index:05}",
+                    "Weekly" if index % 3 == 0 else "Daily", start, start)
+              for index in range(habits_number)]
+    return sorted(habits, key=lambda x: (x.periodicity, x.title))
+
+
+def make_check_offs(habits: list[Habit], today: date, days: int, seed: int = 0) -> Iterable[CheckOff]:
+    ''' Generator of check-offs in the order they would be reported: day by day. Daily habits
+        are done on 80% of days, weekly habits on 20% of days.
+    '''
+    rng = random.Random(seed)
+    for day in range(days, -1, -1):
+        created = today - timedelta(days=day)
+        for habit in habits:
+            if rng.random() < (0.8 if habit.periodicity == "Daily" else 0.2):
+                yield CheckOff(habit.title, rng.randint(0, 5), created)
+
+
+def generate_history(habit_file: str,
+                     check_off_file: str,
+                     habits_number: int,
+                     days: int,
+                     today: date,
+                     seed: int = 0
+                    ) -> tuple[HabitManager, CheckOffManager]:
+    ''' Writes synthetic habit and check-off files and returns managers for them. '''
+    habit_manager = HabitManager(habit_file, today)
+    check_off_manager = CheckOffManager(check_off_file, today)
+    habits = make_habits(habits_number, today, days)
+    habit_manager._save_list(habits)
+    check_off_manager._save_list(make_check_offs(habits, today, days, seed))
+    return habit_manager, check_off_manager
+
+
+def timer(function: Callable[[], Any], repeat: int = 3) -> float:
+    ''' Best time of several runs in seconds. '''
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_dashboard() -> None:
+    ''' Dashboard statistics of all habits for growing histories (see analytics.dashboard_stats). '''
+    today = date(2024, 2, 26)
+    result: list[Any] = [['Habits', 'Check-offs', 'Seconds']]
+    for habits_number, days in ((10, 100), (50, 365), (100, 730), (200, 1095), (400, 1825)):
+        habits = make_habits(habits_number, today, days)
+        groups: dict[str, list[CheckOff]] = {}
+        for check_off in make_check_offs(habits, today, days):
+            groups.setdefault(check_off.habit_title, []).append(check_off)
+        total = sum(len(x) for x in groups.values())
+        seconds = timer(lambda: analytics.dashboard_stats(habits, groups, 5, today), repeat=1)
+        result.append([habits_number, total, round(seconds, 3)])
+    print(tabulate(result, headers='firstrow'))
+
+
+def bench_buffer() -> None:
+    ''' Ingestion of new check-offs one by one through CheckOffManager._append (what
+        report_check_off does): write-through vs write-behind buffer with group commit.
+    '''
+    today = date(2024, 2, 26)
+    check_offs = list(itertools.islice(make_check_offs(make_habits(20, today, 2000), today, 2000), 20_000))
+    result: list[Any] = [['Storage', 'Buffer', 'Durable', 'Check-offs/s']]
+    with tempfile.TemporaryDirectory() as folder:
+        for partition, buffer_size, durable in ((None, 0, False), (None, 1000, False), 
+                                                (None, 0, True), (None, 1000, True),
+                                                ("year", 0, False), ("year", 1000, False)):
+            def ingest() -> None:
+                file_name = os.path.join(folder, "check_off.json")
+                for name in os.listdir(folder): os.remove(os.path.join(folder, name))
+                manager = CheckOffManager(file_name, today, partition, buffer_size, durable=durable)
+                for check_off in check_offs: manager._append(check_off)
+                manager.flush()
+            seconds = timer(ingest, repeat=1)
+            result.append([partition or "single file", buffer_size, durable, int(len(check_offs) / seconds)])
+    print(tabulate(result, headers='firstrow'))
+
+
+def bench_serialize(number: int = 1_000_000) -> None:
+    ''' Streaming a list of check-offs to JSON file with CheckOffManager._save_list. '''
+    today = date(2024, 2, 26)
+    check_offs = list(itertools.islice(make_check_offs(make_habits(100, today, 20_000), today, 20_000),
+                                       number))
+    with tempfile.TemporaryDirectory() as folder:
+        manager = CheckOffManager(os.path.join(folder, "check_off.json"), today)
+        seconds = timer(lambda: manager._save_list(check_offs))
+        size = os.path.getsize(manager.file_name)
+    print(f"_save_list: {len(check_offs)} check-offs, {size / 1e6:.1f} MB in {seconds:.2f} s, "
+          f"{int(len(check_offs) / seconds)} check-offs/s")
+
+
+def bench_fsck(number: int = 2_000_000) -> None:
+    ''' Integrity check and repair of a big check-off file with a few problems: one check-off
+        out of order every 10 000, so that repair has to merge many sorted runs.
+    '''
+    today = date(2024, 2, 26)
+    habits = make_habits(100, today, 40_000)
+    check_offs = list(itertools.islice(make_check_offs(habits, today, 40_000), number))
+    for index in range(10_000, len(check_offs), 10_000):
+        check_offs[index] = CheckOff(check_offs[index].habit_title, 3, check_offs[0].created)
+    with tempfile.TemporaryDirectory() as folder:
+        habit_manager = HabitManager(os.path.join(folder, "habit_data.json"), today)
+        check_off_manager = CheckOffManager(os.path.join(folder, "check_off.json"), today)
+        habit_manager._save_list(habits)
+        check_off_manager._save_list(check_offs)
+        del check_offs
+        seconds = timer(lambda: sum(1 for _ in fsck.check(habit_manager, check_off_manager)), repeat=1)
+        print(f"check: {number} check-offs in {seconds:.2f} s")
+        seconds = timer(lambda: fsck.repair(habit_manager, check_off_manager), repeat=1)
+        print(f"repair: {number} check-offs in {seconds:.2f} s")
+
+
+def bench_scheduler(habits_number: int = 500, days: int = 730) -> None:
+    ''' Due habit scheduler: first build from the whole history, then a check-off of every habit 
+        (deadline update) followed by the query of habits due today, as the check-off menu does.
+    '''
+    today = date(2024, 2, 26)
+    with tempfile.TemporaryDirectory() as folder:
+        habit_manager, check_off_manager = generate_history(
+            os.path.join(folder, "habit_data.json"), os.path.join(folder, "check_off.json"),
+            habits_number, days, today - timedelta(days=1))
+        habit_manager.cache = True
+        scheduler = DueScheduler(habit_manager, check_off_manager)
+        seconds = timer(scheduler.refresh, repeat=1)
+        print(f"build: {habits_number} habits, {days} days of history in {seconds:.2f} s")
+        check_offs = [CheckOff(habit.title, 3, today) for habit in habit_manager.make_gen()]
+        def report() -> None:
+            for check_off in check_offs:
+                check_off_manager._append(check_off)
+                scheduler.due_today()
+        seconds = timer(report, repeat=1)
+        print(f"check-off and due today query: {seconds / len(check_offs) * 1000:.2f} ms")
+
+
+BENCHMARKS = {"dashboard": bench_dashboard, "buffer": bench_buffer, "serialize": bench_serialize,
+              "fsck": bench_fsck, "scheduler": bench_scheduler}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or list(BENCHMARKS):
+        print(f"Benchmark: {name}")
+        BENCHMARKS[name]()
@@ -0,0 +1,139 @@
+# This module exports habits and check-offs history to CSV or JSON Lines files for external analytics.
+# Run: python export.py check_offs history.jsonl --state active --start 2024-01-01 --join
+
+from __future__ import annotations
+import simplejson as json
+import argparse
+import csv
+import io
+import itertools
+from datetime import date
+from typing import Any, Iterable, Optional, Sequence
+from tracker_classes import Habit, HabitManager, CheckOffManager, WRITE_BUFFER
+
+
+EXPORT_BATCH = 2_000        # records formatted in memory before one write to the file
+
+HABIT_FIELDS = ['title', 'description', 'periodicity', 'created', 'descr_update', 'active']
+CHECK_OFF_FIELDS = ['habit_title', 'emotion', 'created']
+JOIN_FIELDS = ['periodicity', 'habit_created', 'descr_update', 'active']
+
+
+def habit_gen(habit_manager: HabitManager,
+              titles: Optional[Sequence[str]] = None,
+              archived: Optional[bool] = None
+             ) -> Iterable[Habit]:
+    ''' Generator of habits with given titles (all if None) and state: archived=False for active,
+        True for archived (same as HabitManager.make_gen) or None for both.
+    '''
+    source = habit_manager._deserialize(Habit) if archived is None else habit_manager.make_gen(archived)
+    yield from (habit for habit in source if titles is None or habit.title in titles)
+
+
+def habit_records(habits: Iterable[Habit]) -> Iterable[dict[str, Any]]:
+    yield from (habit._serialize() for habit in habits)     # type: ignore[attr-defined]
+
+
+def check_off_records(check_off_manager: CheckOffManager,
+                      habits: Optional[dict[str, Habit]] = None,
+                      start: Optional[date] = None,
+                      end: Optional[date] = None,
+                      join: bool = False,
+                      archived: Optional[bool] = None
+                     ) -> Iterable[dict[str, Any]]:
+    ''' Generator of serialized check-offs streamed from the check-off file. Only check-offs of
+        the given habits (a dict by title, all if None) and created from start to end (both
+        included) are passed. With join=True every record gets metadata of its habit, for that
+        habits dict is required. Cold segments of archived habits are read unless archived=False.
+    '''
+    source = check_off_manager.make_gen()
+    if archived is not False:       # history of archived habits is in cold segments
+        source = itertools.chain(source, check_off_manager.cold_gen())
+    for check_off in source:
+        if habits is not None and check_off.habit_title not in habits: continue
+        if start and check_off.created < start: continue
+        if end and check_off.created > end: continue
+        record = check_off._serialize()
+        if join and habits is not None:
+            habit = habits[check_off.habit_title]
+            record.update(periodicity=habit.periodicity, habit_created=str(habit.created),
+                          descr_update=str(habit.descr_update), active=habit.active)
+        yield record
+
+
+def _batches(records: Iterable[dict[str, Any]]) -> Iterable[list[dict[str, Any]]]:
+    records = iter(records)
+    while batch := list(itertools.islice(records, EXPORT_BATCH)):
+        yield batch
+
+
+def write_records(records: Iterable[dict[str, Any]], file_name: str, fields: Sequence[str]) -> int:
+    ''' Writes records to CSV (with header of fields) or JSON Lines file, chosen by file extension:
+        ".jsonl" or ".csv". Records are formatted in batches of EXPORT_BATCH and every batch is
+        written at once, so memory use does not depend on the number of records.
+        Returns number of written records.
+    '''
+    count = 0
+    with open(file_name, "w", encoding="UTF-8", newline="", buffering=WRITE_BUFFER) as file:
+        if file_name.endswith(".jsonl"):
+            for batch in _batches(records):
+                file.write("".join(json.dumps(record) + "\n" for record in batch))
+                count += len(batch)
+        elif file_name.endswith(".csv"):
+            file.write(",".join(fields) + "\r\n")
+            for batch in _batches(records):
+                text = io.StringIO()
+                csv.DictWriter(text, fields).writerows(batch)
+                file.write(text.getvalue())
+                count += len(batch)
+        else:
+            raise ValueError(f"Unknown export format of {file_name!r}, use .csv or .jsonl")
+    return count
+
+
+def export(kind: str,
+           file_name: str,
+           habit_manager: HabitManager,
+           check_off_manager: CheckOffManager,
+           titles: Optional[Sequence[str]] = None,
+           archived: Optional[bool] = None,
+           start: Optional[date] = None,
+           end: Optional[date] = None,
+           join: bool = False
+          ) -> int:
+    ''' Exports "habits" or "check_offs" to file_name with filters by habit titles, state of the
+        habit and creation date (check-offs only). Returns number of exported records.
+    '''
+    habits = habit_gen(habit_manager, titles, archived)
+    if kind == "habits":
+        return write_records(habit_records(habits), file_name, HABIT_FIELDS)
+    if kind == "check_offs":
+        # habit catalog is small, check-offs are streamed
+        catalog = None
+        if titles is not None or archived is not None or join:
+            catalog = {habit.title: habit for habit in habits}
+        fields = CHECK_OFF_FIELDS + JOIN_FIELDS if join else CHECK_OFF_FIELDS
+        return write_records(check_off_records(check_off_manager, catalog, start, end, join, archived),
+                             file_name, fields)
+    raise ValueError(f"Unknown export kind {kind!r}, choose \"habits\" or \"check_offs\"")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export habit tracker data to CSV or JSON Lines.")
+    parser.add_argument("kind", choices=["habits", "check_offs"])
+    parser.add_argument("file_name", help="output file, .csv or .jsonl")
+    parser.add_argument("--habit", action="append", dest="titles", help="habit title, repeatable")
+    parser.add_argument("--state", choices=["active", "archived", "all"], default="all")
+    parser.add_argument("--start", type=date.fromisoformat, help="first date, YYYY-MM-DD")
+    parser.add_argument("--end", type=date.fromisoformat, help="last date, YYYY-MM-DD")
+    parser.add_argument("--join", action="store_true", help="add habit metadata to check-offs")
+    parser.add_argument("--habit-file", default="habit_data.json")
+    parser.add_argument("--check-off-file", default="check_off.json")
+    args = parser.parse_args()
+    today = date.today()
+    number = export(args.kind, args.file_name,
+                    HabitManager(args.habit_file, today),
+                    CheckOffManager(args.check_off_file, today),
+                    args.titles, {"active": False, "archived": True, "all": None}[args.state],
+                    args.start, args.end, args.join)
+    print(f"Done! {number} records exported to {args.file_name}.")
@@ -0,0 +1,389 @@
+# This module checks integrity of habit and check-off files and repairs them.
+# Run: python fsck.py [--repair] [--habit-file habit_data.json] [--check-off-file check_off.json]
+
+from __future__ import annotations
+import simplejson as json
+import argparse
+import functools
+import heapq
+import itertools
+import operator
+import os
+import re
+import sys
+import tempfile
+from collections import Counter
+from datetime import date
+from typing import Any, Callable, Generator, Iterable, Iterator, Optional
+from urllib.parse import unquote
+from tabulate import tabulate
+from tracker_classes import Habit, CheckOff, ObjectManager, HabitManager, CheckOffManager, COLD_OPENERS, WRITE_BUFFER
+from periodicity import periodicity
+
+
+RUN_SIZE = 200_000          # check-offs sorted in memory at once by repair, more are merged from runs
+
+HABIT_KEYS = set(Habit._fields)             # type: ignore[attr-defined]
+CHECK_OFF_KEYS = set(CheckOff._fields)      # type: ignore[attr-defined]
+
+# Violation is (kind, location, message), kinds are:
+# "damaged"   - file can't be read to the end, e.g. cut off during write (no closing "]")
+# "invalid"   - record with wrong fields or values
+# "duplicate" - habit with the same title or check-off of a habit on the same day twice
+# "orphan"    - check-off or cold segment of the habit which does not exist
+# "order"     - habit or check-off out of the order they are stored in
+# "segment"   - partitioned storage: check-off in a wrong segment or manifest not matching segments
+# "cold"      - history of an active habit left in a cold segment
+Violation = tuple[str, str, str]
+
+
+def _read(file_name: str, damage: list[tuple[int, str]], opener: Any = open) -> Iterator[dict[str, Any]]:
+    ''' Records of JSON file read as far as possible. Reading stops at the first record which
+        can't be decoded, then number of good records and the error are added to damage.
+    '''
+    number = 0
+    try:
+        with opener(file_name, "rt", encoding="UTF-8") as file:
+            for number, record in enumerate(ObjectManager._read_records(file), start=1):
+                yield record
+    except FileNotFoundError:
+        pass
+    except (json.JSONDecodeError, EOFError, OSError) as error:    # compressed files end with EOFError
+        damage.append((number, getattr(error, "msg", str(error))))
+
+
+@functools.lru_cache(maxsize=1 << 16)     # there are few different dates, but many check-offs
+def _is_iso_date(value: str) -> bool:
+    try:
+        return len(value) == 10 and bool(date.fromisoformat(value))
+    except ValueError:
+        return False
+
+
+def _is_date(value: Any) -> bool:
+    return type(value) is str and _is_iso_date(value)
+
+
+def _habit_problem(record: Any) -> Optional[str]:
+    if not isinstance(record, dict) or record.keys() != HABIT_KEYS:
+        return f"fields should be {', '.join(Habit._fields)}"               # type: ignore[attr-defined]
+    if not isinstance(record["title"], str) or not record["title"]: return "empty title"
+    if not isinstance(record["description"], str) or not isinstance(record["periodicity"], str):
+        return "description and periodicity should be text"
+    try:
+        periodicity(record["periodicity"])
+    except ValueError:
+        return f"unknown periodicity {record['periodicity']!r}"
+    if not _is_date(record["created"]) or not _is_date(record["descr_update"]): return "wrong date"
+    if not isinstance(record["active"], bool): return "active should be true or false"
+    return None
+
+
+def _check_off_problem(record: Any) -> Optional[str]:
+    if type(record) is not dict or record.keys() != CHECK_OFF_KEYS:
+        return f"fields should be {', '.join(CheckOff._fields)}"            # type: ignore[attr-defined]
+    if type(record["habit_title"]) is not str: return "habit title should be text"
+    emotion = record["emotion"]
+    if type(emotion) is not int or not 0 <= emotion <= 5:                  # bool is not int here
+        return "emotion should be a number from 0 to 5"
+    if not _is_date(record["created"]): return "wrong date"
+    return None
+
+
+def _habit(record: dict[str, Any]) -> Habit:
+    return Habit(**record | {"created": date.fromisoformat(record["created"]),
+                             "descr_update": date.fromisoformat(record["descr_update"])})
+
+
+def _check_off(record: dict[str, Any]) -> CheckOff:
+    return CheckOff(record["habit_title"], record["emotion"], _date(record["created"]))
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _date(value: str) -> date:
+    return date.fromisoformat(value)
+
+
+def _manifest(check_off_manager: CheckOffManager) -> Optional[dict[str, dict[str, Any]]]:
+    try:
+        return check_off_manager._manifest()
+    except (json.JSONDecodeError, KeyError, AttributeError):
+        return None
+
+
+def check_off_files(check_off_manager: CheckOffManager) -> list[tuple[str, Optional[str]]]:
+    ''' Files with check-offs and their segment keys in the order of dates: the single file or
+        segments of the manifest together with segment files on disk missing in the manifest.
+    '''
+    if not check_off_manager.partition: return [(check_off_manager.file_name, None)]
+    folder = os.path.dirname(os.path.abspath(check_off_manager.file_name))
+    base = os.path.splitext(os.path.basename(check_off_manager.file_name))[0]
+    pattern = re.compile(re.escape(base) + r"\.(\d{4}(?:-\d\d)?)\.json")
+    keys = set(_manifest(check_off_manager) or {})
+    keys.update(found.group(1) for name in os.listdir(folder) if (found := pattern.fullmatch(name)))
+    return [(check_off_manager._segment_name(key), key) for key in sorted(keys)]
+
+
+def check_habits(habit_manager: HabitManager, titles: dict[str, bool]) -> Iterator[Violation]:
+    ''' Checks habit file and fills titles with {title: active} of valid habits. '''
+    name = os.path.basename(habit_manager.file_name)
+    damage: list[tuple[int, str]] = []
+    last: tuple[str, str] = ("", "")
+    for number, record in enumerate(_read(habit_manager.file_name, damage), start=1):
+        location = f"{name}, record {number}"
+        if problem := _habit_problem(record):
+            yield ("invalid", location, problem)
+            continue
+        if record["title"] in titles:
+            yield ("duplicate", location, f"habit {record['title']!r} is registered twice")
+            continue
+        titles[record["title"]] = record["active"]
+        if (record["periodicity"], record["title"]) < last:
+            yield ("order", location, "habits should be sorted by periodicity and title")
+        last = max(last, (record["periodicity"], record["title"]))
+    for number, error in damage:
+        yield ("damaged", f"{name}, after record {number}", error)
+
+
+def _check_records(records: Iterable[dict[str, Any]],
+                   name: str,
+                   titles: dict[str, bool],
+                   last: str = "",
+                   key: Optional[str] = None,
+                   habits: Optional[Counter[str]] = None
+                  ) -> Generator[Violation, None, str]:
+    ''' Checks check-off records of one file, yields violations and returns the last date.
+        Every check-off must come after the previous one by date (last is the date before the
+        file) and a habit can't be checked off twice on one date. Dates are compared as ISO
+        text. With key records must belong to this segment. Valid check-offs are counted by
+        habit in habits if it is given.
+    '''
+    day_titles: set[str] = set()           # habits checked off on the date of last check-off
+    for number, record in enumerate(records, start=1):
+        if problem := _check_off_problem(record):
+            yield ("invalid", f"{name}, record {number}", problem)
+            continue
+        title, created = record["habit_title"], record["created"]
+        if habits is not None: habits[title] += 1
+        if title not in titles:
+            yield ("orphan", f"{name}, record {number}", f"habit {title!r} does not exist")
+        if key is not None and not created.startswith(key):
+            yield ("segment", f"{name}, record {number}", f"check-off of {created} in segment {key}")
+        if created > last:
+            last, day_titles = created, {title}
+        elif created < last:
+            yield ("order", f"{name}, record {number}", f"check-off of {created} after check-off of {last}")
+        elif title in day_titles:
+            yield ("duplicate", f"{name}, record {number}", f"habit {title!r} is checked off twice on {created}")
+        else: day_titles.add(title)
+    return last
+
+
+def check_check_offs(check_off_manager: CheckOffManager, titles: dict[str, bool]) -> Iterator[Violation]:
+    ''' Streams check-off file or segments and yields violations with their location. Memory
+        does not depend on the number of check-offs.
+
+        Duplicates are found among check-offs in the order of dates, so duplicates of check-offs
+        out of order may be found only after repair.
+    '''
+    manifest = _manifest(check_off_manager) if check_off_manager.partition else {}
+    if manifest is None:
+        yield ("segment", os.path.basename(check_off_manager.manifest_name), "manifest can't be read")
+    last = ""
+    for file_name, key in check_off_files(check_off_manager):
+        name = os.path.basename(file_name)
+        damage: list[tuple[int, str]] = []
+        habits: Counter[str] = Counter()           # check-offs by habit to compare with manifest
+        last = yield from _check_records(_read(file_name, damage), name, titles, last, key,
+                                         habits if key is not None else None)
+        for number, error in damage:
+            yield ("damaged", f"{name}, after record {number}", error)
+        if key is None or manifest is None: continue
+        if key not in manifest:
+            yield ("segment", name, "segment is not in the manifest")
+        elif not os.path.exists(file_name):
+            yield ("segment", name, "segment of the manifest does not exist")
+        elif (manifest[key].get("count"), manifest[key].get("habits")) != (habits.total(), dict(habits)):
+            yield ("segment", name, f"manifest has {manifest[key].get('count')} check-offs, "
+                                    f"segment has {habits.total()}")
+
+
+def check_cold(check_off_manager: CheckOffManager, titles: dict[str, bool]) -> Iterator[Violation]:
+    ''' Checks cold segments: habit of every segment must exist and be archived. '''
+    if not os.path.isdir(check_off_manager.cold_dir): return
+    for name in sorted(os.listdir(check_off_manager.cold_dir)):
+        extension = next((ext for ext, _ in COLD_OPENERS.values() if name.endswith(ext)), None)
+        if extension is None: continue
+        title = unquote(name[:-len(extension)])
+        location = os.path.join(os.path.basename(check_off_manager.cold_dir), name)
+        if title not in titles:
+            yield ("orphan", location, f"cold segment of habit {title!r} which does not exist")
+            continue
+        if titles[title]:
+            yield ("cold", location, f"habit {title!r} is active, its history should be in main file")
+        damage: list[tuple[int, str]] = []
+        opener = next(opener for ext, opener in COLD_OPENERS.values() if ext == extension)
+        records = _read(os.path.join(check_off_manager.cold_dir, name), damage, opener)
+        yield from _check_records(records, location, {title: False})
+        for number, error in damage:
+            yield ("damaged", f"{location}, after record {number}", error)
+
+
+def check(habit_manager: HabitManager, check_off_manager: CheckOffManager) -> Iterator[Violation]:
+    ''' All violations of the data: habits first, then check-offs and cold segments. Files are
+        read under the shared locks of the managers.
+    '''
+    titles: dict[str, bool] = {}
+    with habit_manager.lock.reading(), check_off_manager.lock.reading():
+        yield from check_habits(habit_manager, titles)
+        yield from check_check_offs(check_off_manager, titles)
+        yield from check_cold(check_off_manager, titles)
+
+
+def sort_records(records: Iterable[dict[str, Any]], 
+                 folder: str, 
+                 run_size: int = RUN_SIZE
+                ) -> Iterator[dict[str, Any]]:
+    ''' Sorts check-off records by date (ISO text) keeping the order of records of the same
+        date. Runs of run_size records are sorted in memory. If there is more than one run, runs
+        are saved to temporary files in the folder and merged. Records stay dicts all the way, 
+        which is much faster than making CheckOff objects for every run.
+    '''
+    created = operator.itemgetter("created")
+    source = iter(records)
+    run = sorted(itertools.islice(source, run_size), key=created)
+    if (extra := next(source, None)) is None:
+        yield from run
+        return
+    source = itertools.chain([extra], source)
+    with tempfile.TemporaryDirectory(dir=folder) as temp_dir:
+        names: list[str] = []
+        while run:
+            names.append(os.path.join(temp_dir, f"run{len(names)}.json"))
+            with open(names[-1], "w", encoding="UTF-8", buffering=WRITE_BUFFER) as file:
+                json.dump(run, file)
+            run = sorted(itertools.islice(source, run_size), key=created)
+        def run_gen(name: str) -> Iterator[dict[str, Any]]:
+            with open(name, encoding="UTF-8") as file:
+                yield from ObjectManager._read_records(file)
+        # merge is stable: of equal dates records of earlier runs come first
+        yield from heapq.merge(*map(run_gen, names), key=created)
+
+
+def merge_stragglers(source: Callable[[], Iterable[dict[str, Any]]],
+                     folder: str,
+                     run_size: int = RUN_SIZE
+                    ) -> Iterator[dict[str, Any]]:
+    ''' Sorts check-off records by date keeping the order of records of the same date. Data
+        is mostly in order, so source() (new stream of the same records every call) is read 
+        twice instead of sorting everything. The first stream gives stragglers: records with 
+        the date before the latest date so far, they are sorted by sort_records. The second
+        stream gives the rest, which is in order already, and is merged with stragglers.
+        Both streams are read side by side, no temporary files unless there are more than 
+        run_size stragglers.
+    '''
+    def split(in_order: bool) -> Iterator[dict[str, Any]]:
+        last = ""
+        for record in source():
+            if record["created"] >= last:
+                last = record["created"]
+                if in_order: yield record
+            elif not in_order: yield record
+    # stragglers of a date come after the record which is in order for this date in the data
+    yield from heapq.merge(split(True), sort_records(split(False), folder, run_size),
+                           key=operator.itemgetter("created"))
+
+
+def repair(habit_manager: HabitManager,
+           check_off_manager: CheckOffManager,
+           run_size: int = RUN_SIZE
+          ) -> Counter[str]:
+    ''' Repairs data under the write locks and returns numbers of dropped records by reason.
+
+        Habits: readable part of the file is kept, invalid habits and second habits with the
+        same title are dropped, the rest is saved sorted.
+        Check-offs: readable part of every file is kept and sorted by date (see 
+        merge_stragglers); invalid check-offs, check-offs of habits which do not exist and
+        second check-offs of a habit on the same date are dropped. Cold segments of active
+        habits are merged into the result, which is written in one pass (segments and manifest
+        are rebuilt for partitioned storage). Cold segments of habits which do not exist are removed.
+    '''
+    dropped: Counter[str] = Counter()
+    with habit_manager.lock.writing(), check_off_manager.lock.writing():
+        habits: dict[str, Habit] = {}
+        damage: list[tuple[int, str]] = []
+        for record in _read(habit_manager.file_name, damage):
+            if _habit_problem(record): dropped["invalid habit"] += 1
+            elif record["title"] in habits: dropped["duplicate habit"] += 1
+            else: habits[record["title"]] = _habit(record)
+        habit_manager._save_habits(habits.values())
+
+        check_off_manager.flush()
+        files: list[tuple[str, Any]] = [(file_name, open) for file_name, _ in check_off_files(check_off_manager)]
+        cold_files: list[tuple[str, Any]] = []      # history of active habits, merged back to the main file
+        for name in os.listdir(check_off_manager.cold_dir) if os.path.isdir(check_off_manager.cold_dir) else []:
+            for extension, opener in COLD_OPENERS.values():
+                if name.endswith(extension) and (habit := habits.get(unquote(name[:-len(extension)]))) \
+                        and habit.active:
+                    cold_files.append((os.path.join(check_off_manager.cold_dir, name), opener))
+        if os.path.exists(check_off_manager.manifest_name):
+            os.remove(check_off_manager.manifest_name)    # rebuilt from the files found
+        counted = False                 # valid_gen runs twice, dropped are counted once
+        def valid_gen() -> Iterator[dict[str, Any]]:
+            nonlocal counted
+            count, counted = not counted, True
+            for file_name, opener in files + cold_files:
+                for record in _read(file_name, [], opener):
+                    if _check_off_problem(record): 
+                        if count: dropped["invalid check-off"] += 1
+                    elif record["habit_title"] not in habits: 
+                        if count: dropped["orphan check-off"] += 1
+                    else: yield record
+        def unique_gen(records: Iterable[dict[str, Any]]) -> Iterator[CheckOff]:
+            last = ""
+            day_titles: set[str] = set()
+            for record in records:
+                if record["created"] != last: last, day_titles = record["created"], set()
+                if record["habit_title"] in day_titles:
+                    dropped["duplicate check-off"] += 1
+                    continue
+                day_titles.add(record["habit_title"])
+                yield _check_off(record)
+        folder = os.path.dirname(os.path.abspath(check_off_manager.file_name))
+        check_off_manager._save_list(unique_gen(merge_stragglers(valid_gen, folder, run_size)))
+        if check_off_manager.partition:          # segments which were not in the manifest
+            segments = {check_off_manager._segment_name(key) for key in check_off_manager._manifest()}
+            for file_name, _ in files:
+                if file_name not in segments and os.path.exists(file_name): os.remove(file_name)
+        for file_name, _ in cold_files: os.remove(file_name)
+
+        for name in os.listdir(check_off_manager.cold_dir) if os.path.isdir(check_off_manager.cold_dir) else []:
+            for extension, _ in COLD_OPENERS.values():
+                if name.endswith(extension) and unquote(name[:-len(extension)]) not in habits:
+                    os.remove(os.path.join(check_off_manager.cold_dir, name))
+                    dropped["orphan cold segment"] += 1
+    return dropped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check integrity of habit tracker data and repair it.")
+    parser.add_argument("--repair", action="store_true", help="repair data after the check")
+    parser.add_argument("--habit-file", default="habit_data.json")
+    parser.add_argument("--check-off-file", default="check_off.json")
+    args = parser.parse_args()
+    today = date.today()
+    habit_manager = HabitManager(args.habit_file, today)
+    check_off_manager = CheckOffManager(args.check_off_file, today)    # partition from the manifest
+    kinds: Counter[str] = Counter()
+    for kind, location, message in check(habit_manager, check_off_manager):
+        kinds[kind] += 1
+        print(f"{location}: {kind}: {message}")
+    if not kinds:
+        print("No problems found.")
+        sys.exit(0)
+    print(tabulate(sorted(kinds.items()), headers=['Problem', 'Number']))
+    if args.repair:
+        dropped = repair(habit_manager, check_off_manager)
+        print("Done! Data is repaired.")
+        if dropped: print(tabulate(sorted(dropped.items()), headers=['Dropped', 'Number']))
+    sys.exit(0 if args.repair else 1)
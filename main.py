@@ -1,6 +1,9 @@
 from __future__ import annotations
 from tracker_classes import HabitManager, CheckOffManager, Habit, CheckOff
-import numpy as np
+from analytics import emotion_stats, habit_stats, group_check_offs, history_table, export_history
+from analytics import dashboard_stats, EmotionCache, emotion_table
+from analytics import completion_matrix, correlations, correlation_table, CORRELATION_HEADER
+from scheduler import DueScheduler
 from datetime import timedelta, date, datetime
 from typing import Union, Optional, Callable, Any
 from tabulate import tabulate
@@ -55,7 +58,7 @@ def check_off_menu() -> None:
         This is done by calling a function check_off().
     '''
     print("Check-off menu")
-    menu_content = {'1': ("Report check-off", "check_off(\"report\")"),
+    menu_content = {'1': ("Report check-off (due habits first)", "check_off(\"report\")"),
                     '2': ("Delete check-off", "check_off(\"delete\")"),
                     '3': ("Return to main menu", "main_menu()"),
                     '4': ("Exit", "")
@@ -69,16 +72,18 @@ def habit_menu() -> None:
         (1) add a new habit, calls method HABIT_MANAGER.add_habit,
         (2) modify habit description, calls HABIT_MANAGER.modify_description,
         (3) archive habit, calls HABIT_MANAGER.archive_habit,
-        (4) delete habit, calls HABIT_MANAGER.delete_habit.
+        (4) make archived habit active again, calls HABIT_MANAGER.unarchive_habit,
+        (5) delete habit, calls HABIT_MANAGER.delete_habit.
        
     '''
     print("Habit menu")
     menu_content = {'1': ("Add new habit", "HABIT_MANAGER.add_habit(MAX_HABIT_TITLE, MAX_HABIT_DESCR)"),
                     '2': ("Modify habit description", "HABIT_MANAGER.modify_description()"),
-                    '3': ("Archive habit", "HABIT_MANAGER.archive_habit()"),
-                    '4': ("Delete habit", "HABIT_MANAGER.delete_habit(CHECK_OFF_MANAGER)"),
-                    '5': ("Return to main menu", "main_menu()"),
-                    '6': ("Exit", "")
+                    '3': ("Archive habit", "HABIT_MANAGER.archive_habit(CHECK_OFF_MANAGER)"),
+                    '4': ("Unarchive habit", "HABIT_MANAGER.unarchive_habit(CHECK_OFF_MANAGER)"),
+                    '5': ("Delete habit", "HABIT_MANAGER.delete_habit(CHECK_OFF_MANAGER)"),
+                    '6': ("Return to main menu", "main_menu()"),
+                    '7': ("Exit", "")
                    }
     while menu_executor(menu_content):
         pass
@@ -86,13 +91,17 @@ def habit_menu() -> None:
         
 def dashboard_menu() -> None:
     ''' This menus if for checking some analytics data oven the active and archived habits.
-        It calls corresponding fucntions: dashboard_active and dashboard_archived.
+        It calls corresponding fucntions: dashboard_active, dashboard_archived, dashboard_correlation,
+        dashboard_emotion and dashboard_history.
     '''
     print("Dashboard menu")
     menu_content = {'1': ("Active habits", "dashboard_active()"),
                     '2': ("Archived habits", "dashboard_archived()"),
-                    '3': ("Return to main menu", "main_menu()"),
-                    '4': ("Exit", "")
+                    '3': ("Habit correlations", "dashboard_correlation()"),
+                    '4': ("Emotion analytics", "dashboard_emotion()"),
+                    '5': ("Export statistics history", "dashboard_history()"),
+                    '6': ("Return to main menu", "main_menu()"),
+                    '7': ("Exit", "")
                    }
     while menu_executor(menu_content):
         pass
@@ -101,11 +110,13 @@ def dashboard_menu() -> None:
 def check_off(action: str) -> Optional[bool]:
     ''' This function asks user to choose a habit which check-offs they want to process.
         Then calls CHECK_OFF_MANAGER.report_check_off method to process new check-off and
-        CHECK_OFF_MANAGER.delete_check_off to delete check-off.
+        CHECK_OFF_MANAGER.delete_check_off to delete check-off. To report a check-off habits
+        are listed by SCHEDULER in the order of their deadlines: overdue, due today and at risk
+        of breaking the streak first.
         
         In the end it starts again check_off_menu.
     '''
-    chosen_habit = HABIT_MANAGER.choose_habit()
+    chosen_habit = SCHEDULER.choose_habit() if action == "report" else HABIT_MANAGER.choose_habit()
     if not chosen_habit: return True
     if action == "report": 
         return CHECK_OFF_MANAGER.report_check_off(chosen_habit, PRINT_NUMBER)
@@ -115,16 +126,21 @@ def check_off(action: str) -> Optional[bool]:
     
 def dashboard_active() -> None:
     ''' This is a fucntion printing a table with habits thier descriptive statistics.
-        Statistics are generated by calling "streak" function. Print is done using 
-        "tabulate" module. 
+        Statistics are the same as generated by "streak" function, but check-off file is read
+        only once for all habits, see analytics.dashboard_stats. Completion rates over RATE_WINDOWS days and since the last
+        description update, target rate and goal status come from the same check-offs.
+        Print is done using "tabulate" module. 
     '''
-    result = [['Habit', 'Type', 'Tenure', 'Status', 'Streak', 'Hiatus',
-               'Max streak', 'Aver emo', 'Emo trend']]
-    all_habits = HABIT_MANAGER.make_gen()   
-    for habit in all_habits:
-        line = [habit.title, habit.periodicity]
-        line += [*streak(habit, CHECK_OFF_MANAGER, ANALYSIS_INSTANCES, TODAY)]          
-        result.append(line)
+    result: list[Any] = [['Habit', 'Type', 'Tenure', 'Status', 'Streak', 'Hiatus',
+                          'Max streak', 'Aver emo', 'Emo trend', 
+                          *[f"{days}d %" for days in RATE_WINDOWS], 'Upd %', 'Target %', 'Goal']]
+    all_habits = list(HABIT_MANAGER.make_gen())
+    if all_habits:
+        groups = group_check_offs(CHECK_OFF_MANAGER)
+        all_stats = dashboard_stats(all_habits, groups, ANALYSIS_INSTANCES, TODAY,
+                                    windows=RATE_WINDOWS, targets=TARGET_RATES)
+        for habit, stats in zip(all_habits, all_stats):
+            result.append([habit.title, habit.periodicity, *stats])
     if len(result) > 1:
         table = tabulate(result, headers='firstrow')
         print(table)
@@ -143,68 +159,28 @@ def streak(habit: Habit,
         Arguments are global constants, which could be used directy, but it does not seem 
         in a functional programming style.
         
-        Fucntion start with definition of a period for Daily and Weekly habit used to identify
-        streaks. Also "Tenure" statistics is calculated showing how habit description is old 
-        in number of periods. This is useful to decide if it is time to change something in the
-        habit goal, for example.
+        "Tenure" statistics shows how habit description is old in number of periods. This is
+        useful to decide if it is time to change something in the habit goal, for example.
         
         Then current streak, maximum streak in the history, status ("Streak", "Broken", "Not
         started", number of missed periods (hiatus), average emotions and emotion trend are calculated 
-        and returned.
+        and returned. Calculation is done by analytics.habit_stats, which shares period rules
+        with the history of statistics (analytics.streak_series).
     '''
     
-    if habit.periodicity == "Daily": 
-        period = timedelta(days=1)
-    elif habit.periodicity == "Weekly": 
-        period = timedelta(days=7)
-    tenure = (today - habit.descr_update) // period   # how many periods habit is old
-    
     # creating sequence of check-offs for a given habit
-    source = check_off_manager.make_gen(habit.title)
-    try:
-        previous: Any = next(source)           # type: ignore [call-overload]
-        streak = 0
-        max_streak = 1
-        for check_off in source:
-            if check_off.created - previous.created <= period:
-                streak += 1
-            elif streak > 0:
-                max_streak = max(max_streak, streak + 1)
-                streak = 0
-            previous = check_off
-        # updating max_streak in case streak was not broken in the end of sequence 
-        max_streak = max(max_streak, streak + 1)   
-    except StopIteration:                                   
-        return tenure, "Not started", 0, 0, 0, "N/D", "N/D"    # no check-offs in history
-    if previous.created >= today - period:
-        status = "Streak"
-        hiatus = 0
-        streak += 1
-    else:
-        hiatus_time = today - previous.created
-        hiatus = int(round(hiatus_time/period,1))
-        status = "Broken"
-        streak = 0
-    check_off_manager.make_list(habit.title, analysis_instances)  # making truncated list for emotion
-    return tenure, status, streak, hiatus, max_streak, *emotion(check_off_manager)
+    check_off_manager.make_list(habit.title)
+    result = habit_stats(habit, check_off_manager.object_list, analysis_instances, today)
+    # truncated list of recent check-offs is left for emotion function
+    check_off_manager.object_list = check_off_manager.object_list[-analysis_instances:]
+    return result
 
 
 def emotion(check_off_manager: "CheckOffManager") -> Union[tuple[float, str], tuple[str, str]]:
     ''' Returns average emption level and trend for the given sequence of check-offs.
-        To calculate trend polyfit function from numpy module is used. This is linear
-        regression. We use slope coefficient sign to set the trend to "Negative" 
-        (negative slope sign), "Neutral" or "Positive". 
+        Calculation itself is done by analytics.emotion_stats.
     '''
-    
-    if len(check_off_manager.object_list) < 2: return "N/D", "N/D"
-    data = [element.emotion for element in check_off_manager.object_list]
-    time_range = np.arange(0, len(data))
-    array_data = np.array(data)
-    result = np.polyfit(time_range, array_data, 1)
-    if round(result[0], 1) > 0: trend = "Positive"
-    elif round(result[0], 1) == 0: trend = "Neutral"
-    else: trend = "Negative"
-    return round(sum(data)/len(data), 1), trend     # return average emotion and trend
+    return emotion_stats([element.emotion for element in check_off_manager.object_list])
 
 
 def dashboard_archived():
@@ -212,6 +188,8 @@ def dashboard_archived():
         and Average Emotion, calculated by streak fucntion. It is not supposed to be 
         used very often, otherwise it is possible to calculate statistics once in the
         moment of archiving and store them in Habit objects to avoid extra calculations.
+        History of each archived habit is read from its own cold segment, the main check-off
+        file is not touched.
     '''
     result = [['Habit', 'Type', 'Description', 'Max streak', 'Aver emo']]
     all_habits = HABIT_MANAGER.make_gen(archived=True)   
@@ -225,6 +203,57 @@ def dashboard_archived():
         print(table)
     else: print("There is no archived habits.")
     dashboard_menu()
+
+
+def dashboard_correlation() -> None:
+    ''' This function prints pairs of active habits which go together most often: how often
+        both are done the same day, probability to do habit B on the day habit A is done and 
+        correlation of emotions on such days. Check-off file is read once into a habits x days 
+        matrix, then all pairs are calculated by analytics.correlations.
+    '''
+    habits = list(HABIT_MANAGER.make_gen())
+    if len(habits) < 2:
+        print("There should be at least two active habits to compare.")
+        return dashboard_menu()
+    titles = [habit.title for habit in habits]
+    start = min(habit.created for habit in habits)
+    done, emotions = completion_matrix(CHECK_OFF_MANAGER, titles, start, TODAY)
+    result = correlation_table(titles, *correlations(done, emotions), CORRELATION_PAIRS)
+    if result:
+        table = tabulate([CORRELATION_HEADER, *result], headers='firstrow')
+        print(table)
+    else: print("There is no habits done on the same day yet.")
+    dashboard_menu()
+
+
+def dashboard_emotion() -> None:
+    ''' This function prints emotion analytics of active habits over the whole history: mean 
+        emotion over the last EMOTION_WINDOWS days, exponentially weighted average, days of the
+        week with the best and worst emotions and long-term trend with its p-value. Results are 
+        kept in EMOTION_CACHE, so the check-off file is read again only after new check-offs.
+    '''
+    titles = [habit.title for habit in HABIT_MANAGER.make_gen()]
+    if not titles:
+        print("There is no active habits registered. Register first one.")
+        return dashboard_menu()
+    header = ['Habit', *[f"Emo {days}d" for days in EMOTION_WINDOWS], 'EWMA', 'Best day', 
+              'Worst day', f"Trend {TREND_DAYS}d", 'p-value %']
+    result = emotion_table(titles, EMOTION_CACHE.profiles_for(titles))
+    table = tabulate([header, *result], headers='firstrow')
+    print(table)
+    dashboard_menu()
+
+
+def dashboard_history() -> None:
+    ''' This function exports statistics of every active habit for every day since the habit
+        was created till today, as if "streak" function was called that day. File is read once
+        and the series is calculated in one pass, see analytics.streak_series. 
+    '''
+    groups = group_check_offs(CHECK_OFF_MANAGER)
+    rows = history_table(HABIT_MANAGER.make_gen(), groups, ANALYSIS_INSTANCES, TODAY)
+    export_history(rows, HISTORY_FILE)
+    print(f"Done! Statistics history is saved to {HISTORY_FILE}.")
+    dashboard_menu()
     
 
 if __name__ == "__main__":
@@ -234,8 +263,22 @@ if __name__ == "__main__":
     MAX_HABIT_DESCR = 45    # max length of habit description for nice table print
     ANALYSIS_INSTANCES = 5  # number of instances to analyse for emotion function
     TODAY = date.today()    # today date used for creating and modifying objects
+    CHECK_OFF_PARTITION = None  # None for one check-off file, "year" or "month" for segment files
+    CHECK_OFF_BUFFER = 0    # new check-offs saved together, 0 to save every check-off at once
+    CACHE = True            # binary cache of parsed data files next to them, faster start with long history
+    EMOTION_WINDOWS = (7, 30, 90)   # days of windows for average emotion in emotion analytics
+    EMOTION_ALPHA = 0.3     # smoothing of exponentially weighted average emotion
+    TREND_DAYS = 90         # days of history for emotion trend in emotion analytics
+    RATE_WINDOWS = (7, 30, 90, 365)     # days of windows for completion rates in active dashboard
+    TARGET_RATES = {"Daily": 80.0, "Weekly": 90.0}  # target completion %, by periodicity or habit title
+    CORRELATION_PAIRS = 10  # number of habit pairs to print in correlation dashboard
+    RISK_DAYS = 2           # habit with a streak is at risk if it must be checked-off within these days
+    HISTORY_FILE = "habit_history.csv"  # CSV or JSON file for statistics history export
     
     # creating two main classes instances to use their methods
-    HABIT_MANAGER = HabitManager("habit_data.json", TODAY)
-    CHECK_OFF_MANAGER = CheckOffManager("check_off.json", TODAY)
+    HABIT_MANAGER = HabitManager("habit_data.json", TODAY, cache=CACHE)
+    CHECK_OFF_MANAGER = CheckOffManager("check_off.json", TODAY, CHECK_OFF_PARTITION, CHECK_OFF_BUFFER, 
+                                        cache=CACHE)
+    EMOTION_CACHE = EmotionCache(CHECK_OFF_MANAGER, EMOTION_WINDOWS, EMOTION_ALPHA, TREND_DAYS)
+    SCHEDULER = DueScheduler(HABIT_MANAGER, CHECK_OFF_MANAGER, RISK_DAYS)
     main_menu()
\ No newline at end of file
@@ -0,0 +1,78 @@
+# This module parses periodicity of habits and splits days into periods of a habit: rolling periods
+# of "Daily" and "Weekly" habits or calendar-aligned ISO weeks, months and every N days.
+
+from __future__ import annotations
+import re
+from dataclasses import dataclass
+from datetime import date
+from functools import lru_cache
+import numpy as np
+
+
+# Ordinal of 1970-01-01, day 0 of numpy datetime64
+EPOCH = date(1970, 1, 1).toordinal()
+
+# Choices of add_habit: number -> periodicity text, N and K are asked from the user
+CHOICES = {"1": "Daily", "2": "Weekly", "3": "ISO weekly", "4": "Monthly", "5": "Every {n} days",
+           "6": "{k} per week", "7": "{k} per month"}
+
+
+@dataclass(frozen=True)
+class Period:
+    ''' Rule of a habit periodicity, made from the text kept in Habit.periodicity by periodicity():
+        - "Daily", "Weekly": rolling periods of 1 or 7 days, next check-off not later than one
+          period after the previous one continues the streak (rules of the first app version),
+        - "ISO weekly": calendar weeks from Monday to Sunday,
+        - "Monthly": calendar months,
+        - "Every N days": periods of N days starting with the day the habit was created,
+        - "K per week", "K per month", "K per N days": the same calendar periods, but K
+          check-offs are needed to complete one period.
+    '''
+    unit: str           # "rolling", "days", "week" or "month"
+    days: int           # length of the period in days, for months average of 30 days
+    times: int = 1      # check-offs needed to complete the period
+
+    def index(self, ordinals: np.ndarray, origin: int) -> np.ndarray:
+        ''' Period number of every day in the array of date ordinals (date.toordinal()), only
+            integer arithmetic on the whole array. Periods of days start at origin ordinal,
+            weeks on Mondays (ordinal 1 is Monday) and months on the first day of the month.
+            Numbers of periods in a row differ by 1.
+        '''
+        if self.unit == "week": return (ordinals - 1) // 7
+        if self.unit == "month":      # months since January 1970
+            return (ordinals - EPOCH).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        return (ordinals - origin) // self.days
+
+    def last_day(self, periods: np.ndarray, origin: int) -> np.ndarray:
+        ''' Ordinal of the last day of every period number, the inverse of index. '''
+        if self.unit == "week": return periods * 7 + 7
+        if self.unit == "month":
+            return (periods + 1).astype("datetime64[M]").astype("datetime64[D]").astype(np.int64) + EPOCH - 1
+        return origin + (periods + 1) * self.days - 1
+
+
+# text pattern -> unit, default length in days and check-offs per period
+PATTERNS = [(re.compile(r"daily"), "rolling", 1, 1),
+            (re.compile(r"weekly"), "rolling", 7, 1),
+            (re.compile(r"iso weekly"), "week", 7, 1),
+            (re.compile(r"monthly"), "month", 30, 1),
+            (re.compile(r"every (?P<n>\d+) days?"), "days", 1, 1),
+            (re.compile(r"(?P<k>\d+) per week"), "week", 7, 1),
+            (re.compile(r"(?P<k>\d+) per month"), "month", 30, 1),
+            (re.compile(r"(?P<k>\d+) per (?P<n>\d+) days?"), "days", 1, 1)]
+
+
+@lru_cache(maxsize=None)        # few different periodicities, called for every habit
+def periodicity(text: str) -> Period:
+    ''' Period rule for the periodicity text of a habit (see Period), case is ignored.
+        Raises ValueError for unknown text or zero N or K.
+    '''
+    for pattern, unit, days, times in PATTERNS:
+        found = pattern.fullmatch(text.strip().lower())
+        if found:
+            values = found.groupdict()
+            days, times = int(values.get("n") or days), int(values.get("k") or times)
+            if days < 1 or times < 1: break
+            return Period(unit, days, times)
+    raise ValueError(f"Unknown periodicity {text!r}, choose one of: "
+                     f"{', '.join(CHOICES.values()).format(n='N', k='K')}")
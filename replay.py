@@ -0,0 +1,198 @@
+# This module replays scripted user sessions through the menus of main.py and reports latency of every operation.
+# Run: python replay.py --habits 20 --days 365 --output report.json [--compare old_report.json]
+
+from __future__ import annotations
+import simplejson as json
+import argparse
+import builtins
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Any, Callable, Iterator, Optional
+import numpy as np
+from tabulate import tabulate
+import main
+from tracker_classes import CheckOffManager, HabitManager
+from benchmark import generate_history
+from analytics import EmotionCache
+from scheduler import DueScheduler
+
+
+# Settings of main.py used in replay, the same as defaults of the app
+MAIN_SETTINGS: dict[str, Any] = {"PRINT_NUMBER": 5, "MAX_HABIT_TITLE": 20, "MAX_HABIT_DESCR": 45,
+                                  "ANALYSIS_INSTANCES": 5,
+                                  "EMOTION_WINDOWS": (7, 30, 90), "EMOTION_ALPHA": 0.3, "TREND_DAYS": 90,
+                                  "RATE_WINDOWS": (7, 30, 90, 365), "TARGET_RATES": {"Daily": 80.0, "Weekly": 90.0},
+                                  "CORRELATION_PAIRS": 10, "RISK_DAYS": 2, "CACHE": True}
+
+# Input sequences from the main menu to the end of operation. Last input always exits the app.
+# Habit number and emotion are put in by format.
+SCRIPTS = {"report": ["1", "1", "{habit}", "{emotion}", "4"],
+           "delete check-off": ["1", "2", "{habit}", "1", "4"],
+           "add habit": ["2", "1", "YES", "{title}", "{description}", "1", "YES", "7"],
+           "archive habit": ["2", "3", "{habit}", "7"],
+           "dashboard active": ["3", "1", "7"],
+           "dashboard archived": ["3", "2", "7"],
+           "dashboard correlation": ["3", "3", "7"],
+           "dashboard emotion": ["3", "4", "7"],
+           "export history": ["3", "5", "7"]}
+
+
+class Replay:
+    ''' Runs operations against the app with data in the folder. Each operation starts from
+        main_menu with its scripted inputs, output of the app is dropped. For every operation
+        its latency and files opened, replaced or removed are recorded.
+    '''
+    def __init__(self, folder: str, today: date, partition: Optional[str] = None, buffer_size: int = 0) -> None:
+        self.folder = folder
+        self.today = today
+        self.habit_manager = HabitManager(os.path.join(folder, "habit_data.json"), today,
+                                          cache=MAIN_SETTINGS["CACHE"])
+        self.check_off_manager = CheckOffManager(os.path.join(folder, "check_off.json"), today,
+                                                 partition, buffer_size, cache=MAIN_SETTINGS["CACHE"])
+        self.latency: dict[str, list[float]] = {}
+        self.files: dict[str, dict[str, int]] = {}
+        for name, value in MAIN_SETTINGS.items(): setattr(main, name, value)
+        main.HABIT_MANAGER = self.habit_manager
+        main.CHECK_OFF_MANAGER = self.check_off_manager
+        main.HISTORY_FILE = os.path.join(folder, "habit_history.csv")
+        main.EMOTION_CACHE = EmotionCache(self.check_off_manager, main.EMOTION_WINDOWS,
+                                          main.EMOTION_ALPHA, main.TREND_DAYS)
+        main.SCHEDULER = DueScheduler(self.habit_manager, self.check_off_manager, main.RISK_DAYS)
+        self.set_day(today)
+
+    def set_day(self, today: date) -> None:
+        self.today = main.TODAY = self.habit_manager.today = self.check_off_manager.today = today
+
+    def active_titles(self) -> list[str]:
+        return [habit.title for habit in self.habit_manager.make_gen()]
+
+    def due_number(self, title: str) -> int:
+        ''' Number of the habit in the list of the report menu, which is ordered by deadlines. '''
+        return [habit.title for habit, _ in main.SCHEDULER.ordered()].index(title) + 1
+
+    @contextlib.contextmanager
+    def _watch_files(self, touched: dict[str, int]) -> Iterator[None]:
+        ''' Counts file names passed to open (also used by gzip and lzma), os.replace and os.remove.
+            Lock files of the managers are not data files and are not counted.
+        '''
+        originals: list[tuple[Any, str, Callable[..., Any]]] = [
+            (builtins, "open", builtins.open), (os, "replace", os.replace), (os, "remove", os.remove)]
+        def watch(function: Callable[..., Any]) -> Callable[..., Any]:
+            def wrapper(file_name: Any, *args: Any, **kwargs: Any) -> Any:
+                if isinstance(file_name, str) and not file_name.endswith(".lock"):
+                    name = os.path.relpath(file_name, self.folder).removesuffix(".tmp")
+                    touched[name] = touched.get(name, 0) + 1
+                return function(file_name, *args, **kwargs)
+            return wrapper
+        for module, name, function in originals: setattr(module, name, watch(function))
+        try:
+            yield
+        finally:
+            for module, name, function in originals: setattr(module, name, function)
+
+    def run(self, operation: str, **values: Any) -> None:
+        ''' Runs one operation from SCRIPTS with values for its inputs. '''
+        inputs = iter([entry.format(**values) for entry in SCRIPTS[operation]])
+        touched: dict[str, int] = {}
+        original_input = builtins.input
+        builtins.input = lambda *_: next(inputs)      # type: ignore[assignment]
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), self._watch_files(touched):
+                start = time.perf_counter()
+                try:
+                    main.main_menu()
+                except SystemExit:
+                    pass
+                seconds = time.perf_counter() - start
+        finally:
+            builtins.input = original_input
+        if next(inputs, None) is not None:
+            raise RuntimeError(f"Operation {operation!r} did not use all its inputs")
+        self.latency.setdefault(operation, []).append(seconds)
+        files = self.files.setdefault(operation, {})
+        for name, count in touched.items(): files[name] = max(files.get(name, 0), count)
+
+    def report(self) -> dict[str, Any]:
+        ''' Latency percentiles in milliseconds and files touched (max times per operation). '''
+        result: dict[str, Any] = {}
+        for operation, values in sorted(self.latency.items()):
+            p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+            result[operation] = {"count": len(values), "p50_ms": round(float(p50), 2),
+                                 "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2),
+                                 "files": dict(sorted(self.files[operation].items()))}
+        return result
+
+
+def session(replay: Replay, days: int, seed: int = 0) -> None:
+    ''' Realistic session: a few new habits first, then every day most active habits are
+        reported, sometimes a check-off is deleted, dashboards are opened once a week and once
+        a month a habit is archived and the history is exported.
+    '''
+    rng = random.Random(seed)
+    for index in range(3):
+        replay.run("add habit", title=f"Replay habit {index}", description=f"Replay description {index}")
+    start = replay.today
+    for day in range(days):
+        replay.set_day(start + timedelta(days=day))
+        titles = replay.active_titles()
+        for title in titles:
+            if rng.random() < 0.7:
+                replay.run("report", habit=replay.due_number(title), emotion=rng.randint(0, 5))
+        if titles and rng.random() < 0.05:
+            replay.run("delete check-off", habit=rng.randint(1, len(titles)))
+        if day % 7 == 6:
+            for operation in ("dashboard active", "dashboard archived", "dashboard correlation",
+                              "dashboard emotion"):
+                replay.run(operation)
+        if day % 30 == 29:
+            if len(titles) > 3: replay.run("archive habit", habit=rng.randint(1, len(titles)))
+            replay.run("export history")
+    replay.check_off_manager.flush()
+
+
+def compare(old: dict[str, Any], new: dict[str, Any]) -> None:
+    ''' Prints p50/p95/p99 of two reports side by side with the ratio new/old. '''
+    result: list[Any] = [['Operation', 'Old p50', 'New p50', 'Old p95', 'New p95',
+                          'Old p99', 'New p99', 'p95 ratio']]
+    for operation in sorted(old.keys() | new.keys()):
+        before, after = old.get(operation, {}), new.get(operation, {})
+        ratio = (round(after["p95_ms"] / before["p95_ms"], 2)
+                 if before.get("p95_ms") and after.get("p95_ms") else "N/D")
+        result.append([operation, *[x.get(key, "N/D") for key in ("p50_ms", "p95_ms", "p99_ms")
+                                    for x in (before, after)], ratio])
+    print(tabulate(result, headers='firstrow'))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay scripted sessions through main.py menus.")
+    parser.add_argument("--habits", type=int, default=20, help="habits in generated history")
+    parser.add_argument("--history-days", type=int, default=365, help="days of generated history")
+    parser.add_argument("--days", type=int, default=365, help="days of replayed session")
+    parser.add_argument("--partition", choices=["year", "month"])
+    parser.add_argument("--buffer", type=int, default=0, help="check-off buffer size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="replay_report.json")
+    parser.add_argument("--compare", help="earlier report to compare with")
+    args = parser.parse_args()
+    today = date(2024, 1, 1)
+    with tempfile.TemporaryDirectory() as folder:
+        generate_history(os.path.join(folder, "habit_data.json"), os.path.join(folder, "check_off.json"),
+                         args.habits, args.history_days, today - timedelta(days=1), args.seed)
+        replay = Replay(folder, today, args.partition, args.buffer)
+        session(replay, args.days, args.seed)
+        report = {"settings": vars(args) | {"output": None, "compare": None},
+                  "operations": replay.report()}
+    with open(args.output, "w", encoding="UTF-8") as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+    print(tabulate([[operation, *[stats[key] for key in ("count", "p50_ms", "p95_ms", "p99_ms")],
+                     ", ".join(stats["files"])]
+                    for operation, stats in report["operations"].items()],
+                   headers=['Operation', 'Count', 'p50, ms', 'p95, ms', 'p99, ms', 'Files']))
+    if args.compare:
+        with open(args.compare, encoding="UTF-8") as file:
+            compare(json.load(file)["operations"], report["operations"])
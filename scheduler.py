@@ -0,0 +1,213 @@
+# This module schedules active habits by their deadlines: the last day a check-off keeps the streak
+# of the habit, found from the last check-offs and the periodicity of the habit.
+
+from __future__ import annotations
+import heapq
+import os
+from array import array
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Iterator, Optional
+import numpy as np
+from tabulate import tabulate
+from tracker_classes import Habit, CheckOff, HabitManager, CheckOffManager
+from periodicity import Period, periodicity
+
+
+RISK_DAYS = 2       # habit with a streak is at risk if its deadline is within these days from today
+
+
+@dataclass
+class DueState:
+    ''' All the deadline of a habit depends on, updated by every new check-off. '''
+    last: Optional[int] = None      # ordinal of the last check-off
+    period: Optional[int] = None    # period of the last check-off (see periodicity.Period)
+    count: int = 0                  # check-offs in that period
+    done: Optional[int] = None      # last period with enough check-offs
+
+    @classmethod
+    def of(cls, rule: Period, ordinals: np.ndarray, origin: int) -> DueState:
+        ''' State from ordinals of all check-offs of the habit, in any order. '''
+        if not len(ordinals): return cls()
+        numbers, counts = np.unique(rule.index(ordinals, origin), return_counts=True)
+        done = numbers[counts >= rule.times]
+        return cls(int(ordinals.max()), int(numbers[-1]), int(counts[-1]),
+                   int(done[-1]) if len(done) else None)
+
+    def add(self, rule: Period, ordinal: int, origin: int) -> None:
+        ''' Adds a new check-off, not older than the last one. '''
+        period = int(rule.index(np.array([ordinal]), origin)[0])
+        if self.period is None or period > self.period: self.period, self.count = period, 0
+        self.count += 1
+        if self.count >= rule.times: self.done = period
+        self.last = ordinal
+
+    def needed(self, rule: Period, today: int, origin: int) -> bool:
+        ''' True if the habit has a streak (it goes on till the deadline) and it is not done in 
+            the current period yet: checked-off today for rolling periods.
+        '''
+        if rule.unit == "rolling": return self.last is not None and self.last < today
+        return self.done is not None and self.done < int(rule.index(np.array([today]), origin)[0])
+
+
+def deadline(habit: Habit, state: DueState) -> int:
+    ''' Ordinal of the last day when a check-off keeps the streak (see analytics.streak_series):
+        one rolling period after the last check-off, or the end of the period after the last done
+        one. If the habit was not done yet, the end of the first period of the habit.
+    '''
+    rule = periodicity(habit.periodicity)
+    origin = habit.created.toordinal()
+    if rule.unit == "rolling":
+        return state.last + rule.days if state.last is not None else origin + rule.days - 1
+    done = state.done if state.done is not None else int(rule.index(np.array([origin]), origin)[0]) - 1
+    return int(rule.last_day(np.array([done + 1]), origin)[0])
+
+
+class DueScheduler:
+    ''' Active habits in a heap by deadline. Deadlines are found once from the history of
+        check-offs, then every new check-off (CheckOffManager calls checked_off from its
+        append_hooks) moves only the deadline of its habit: O(log n) for n habits. Habits
+        changed in other ways (deleted check-offs, new, modified or archived habits) are found
+        by versions of their history (see CheckOffManager.habit_version) and by the habit file,
+        and recalculated before the next query.
+
+        Old heap entry of the moved deadline is left in the heap and skipped as stale, the heap
+        is rebuilt when stale entries outnumber live ones. Queries walk the heap in the order of
+        deadlines without changing it, so k earliest habits cost O(k log k).
+    '''
+    def __init__(self,
+                 habit_manager: HabitManager,
+                 check_off_manager: CheckOffManager,
+                 risk_days: int = RISK_DAYS
+                ) -> None:
+        self.habit_manager = habit_manager
+        self.check_off_manager = check_off_manager
+        self.risk_days = risk_days
+        self.habits: dict[str, Habit] = {}
+        self.states: dict[str, DueState] = {}
+        self.versions: dict[str, tuple[int, int]] = {}  # history versions the states are made from
+        self.deadlines: dict[str, int] = {}
+        self.heap: list[tuple[int, str]] = []             # (deadline, title), some are stale
+        self.habit_key: Optional[tuple[int, ...]] = None  # inode, size and mtime of the habit file read
+        check_off_manager.append_hooks.append(self.checked_off)
+
+    @property
+    def today(self) -> date:
+        return self.check_off_manager.today
+
+    def _push(self, title: str) -> None:
+        self.deadlines[title] = deadline(self.habits[title], self.states[title])
+        heapq.heappush(self.heap, (self.deadlines[title], title))
+        if len(self.heap) > 2 * len(self.deadlines) + 16:
+            self.heap = [(value, title) for title, value in self.deadlines.items()]
+            heapq.heapify(self.heap)
+
+    def _remove(self, title: str) -> None:
+        for table in (self.habits, self.states, self.versions, self.deadlines): table.pop(title, None)
+
+    def checked_off(self, check_off: CheckOff) -> None:
+        ''' Moves the deadline of the habit after its new check-off. If the state missed other
+            changes of the history (every change adds 1 to the habit version), it is left for
+            refresh to recalculate.
+        '''
+        title = check_off.habit_title
+        version, habit_version = self.check_off_manager.habit_version(title)
+        if title not in self.habits or self.versions.get(title) != (version, habit_version - 1): return
+        habit = self.habits[title]
+        self.states[title].add(periodicity(habit.periodicity), check_off.created.toordinal(),
+                               habit.created.toordinal())
+        self.versions[title] = (version, habit_version)
+        self._push(title)
+
+    def refresh(self) -> None:
+        ''' Takes active habits from the habit file if it is changed and recalculates states of
+            new and changed habits from their history: the check-off file is read once for all of
+            them, or only the history of the habit if it is the only one. Check-offs changed by
+            other processes change versions of all habits (see CheckOffManager.check_external).
+        '''
+        self.check_off_manager.check_external()
+        try:
+            stat = os.stat(self.habit_manager.file_name)
+            key: Optional[tuple[int, ...]] = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            key = None
+        if key is None or key != self.habit_key:       # habit file is read only when it is changed
+            habits = {habit.title: habit for habit in self.habit_manager.make_gen()}
+            self.habit_key = key
+        else:
+            habits = self.habits
+        for title in self.habits.keys() - habits.keys(): self._remove(title)
+        manager = self.check_off_manager
+        stale = {title: manager.habit_version(title) for title, habit in habits.items()
+                 if self.habits.get(title) != habit or self.versions.get(title) != manager.habit_version(title)}
+        if not stale: return
+        ordinals = {title: array("i") for title in stale}
+        source = manager.snapshot(next(iter(stale))) if len(stale) == 1 else manager.make_gen()
+        for check_off in source:
+            if (days := ordinals.get(check_off.habit_title)) is not None: days.append(check_off.created.toordinal())
+        for title, version in stale.items():
+            habit = self.habits[title] = habits[title]
+            self.states[title] = DueState.of(periodicity(habit.periodicity),
+                                             np.frombuffer(ordinals[title], dtype=np.int32),
+                                             habit.created.toordinal())
+            self.versions[title] = version
+            self._push(title)
+
+    def ordered(self, until: Optional[date] = None) -> Iterator[tuple[Habit, date]]:
+        ''' Active habits with deadlines, the earliest first (then by title), till the until date
+            if given. The heap is walked from the root with a second heap of its nodes.
+        '''
+        self.refresh()
+        limit = until.toordinal() if until else None
+        seen: set[str] = set()
+        frontier = [(self.heap[0], 0)] if self.heap else []
+        while frontier:
+            (value, title), node = heapq.heappop(frontier)
+            if limit is not None and value > limit: break
+            if self.deadlines.get(title) == value and title not in seen:
+                seen.add(title)
+                yield self.habits[title], date.fromordinal(value)
+            for child in (2 * node + 1, 2 * node + 2):
+                if child < len(self.heap): heapq.heappush(frontier, (self.heap[child], child))
+
+    def overdue(self) -> list[tuple[Habit, date]]:
+        ''' Habits with the deadline before today: the streak is broken or was not started in time. '''
+        return list(self.ordered(self.today - timedelta(days=1)))
+
+    def due_today(self) -> list[tuple[Habit, date]]:
+        ''' Habits with today as the deadline. '''
+        return [(habit, day) for habit, day in self.ordered(self.today) if day == self.today]
+
+    def _needed(self, habit: Habit) -> bool:
+        return self.states[habit.title].needed(periodicity(habit.periodicity), self.today.toordinal(),
+                                               habit.created.toordinal())
+
+    def at_risk(self) -> list[tuple[Habit, date]]:
+        ''' Habits with a streak which breaks unless they are checked-off in risk_days. '''
+        return [(habit, day) for habit, day in self.ordered(self.today + timedelta(days=self.risk_days - 1))
+                if day >= self.today and self._needed(habit)]
+
+    def status(self, habit: Habit, day: date) -> str:
+        if day < self.today: return "Overdue"
+        if day == self.today: return "Due today"
+        if day < self.today + timedelta(days=self.risk_days) and self._needed(habit): return "At risk"
+        return ""
+
+    def choose_habit(self) -> Optional[Habit]:
+        ''' Same as HabitManager.choose_habit, but active habits are listed in the order of
+            deadlines with their status: overdue first, then due today and at risk.
+        '''
+        entries = list(self.ordered())
+        if not entries:
+            print("There is no habits registred yet. Register your first habit.")
+            return None
+        print(tabulate([['N', 'Habit', 'Type', 'Deadline', 'Status'],
+                        *[[number, habit.title, habit.periodicity, day, self.status(habit, day)]
+                          for number, (habit, day) in enumerate(entries, start=1)]], headers='firstrow'))
+        habit_num = int(input("Choose a habit:"))
+        if len(entries) < habit_num or habit_num < 1:
+            print(f"Input number is less than 1 or more than {len(entries)}. Try again.")
+            return None
+        chosen_habit = entries[habit_num - 1][0]
+        print(f"You chose: {chosen_habit.title!r}")
+        return chosen_habit
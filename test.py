@@ -1,12 +1,17 @@
 from __future__ import annotations
 import os
+import multiprocessing
+import threading
+import time
+import tracemalloc
 import sys
 sys.path.append('C:/Users/shevc/Habits')
 
-import main, tracker_classes           # type: ignore[import]
+import main, tracker_classes, analytics, export, replay, benchmark, fsck, periodicity, scheduler  # type: ignore[import]
 import pytest
+import numpy as np
 from datetime import timedelta, date
-from typing import Any
+from typing import Any, Generator, Iterator
 
 # type annotations for mypy
 HabitManager: Any
@@ -19,6 +24,13 @@ def today() -> date:
     #setting up a date for today variable so we know what to expect in returns dependent on today date
     return date(2024, 2, 26)
 
+@pytest.fixture(autouse=True)
+def lock_files() -> Iterator[None]:
+    # managers leave lock files next to their data files, they are removed after every test
+    yield
+    for name in os.listdir("."):
+        if name.endswith(".json.lock"): os.remove(name)
+
 @pytest.fixture
 def some_menu() -> dict[str, tuple[str,str]]:
     '''Returns an arbitrary menu object example'''
@@ -136,7 +148,7 @@ def habit_instance(today: date) -> "HabitManager":
                                               date(2024, 1, 1),
                                               True
                                              )
-    habit_manager.object_list.append(test_habit_daily)
+    habits = [test_habit_daily]
     test_habit_weekly = tracker_classes.Habit("Weekly habit title", 
                                              "Weekly habit description",
                                              "Weekly",
@@ -144,8 +156,9 @@ def habit_instance(today: date) -> "HabitManager":
                                               date(2024, 1, 1),
                                               True
                                              )
-    habit_manager.object_list.append(test_habit_weekly)
-    habit_manager._save_list(habit_manager.object_list)
+    habits.append(test_habit_weekly)
+    habit_manager._save_list(habits)
+    habit_manager.make_list()
     return habit_manager
     
 
@@ -195,12 +208,13 @@ def test_archive_habit(monkeypatch: pytest.MonkeyPatch, habit_instance: "Habit")
 def check_off_instance(today: date) -> "CheckOffManager":
     # creating a check_off
     check_off_manager = tracker_classes.CheckOffManager("test_check_off.json", today)
+    check_offs = []
     for created in (today - timedelta(days=1), today):
         test_check_off = tracker_classes.CheckOff("Daily habit title", 
                                                    5,
                                                    created, 
                                                   )
-        check_off_manager.object_list.append(test_check_off)
+        check_offs.append(test_check_off)
     for created in (today - timedelta(days=7),
                     today - timedelta(days=6)
                    ):
@@ -208,8 +222,9 @@ def check_off_instance(today: date) -> "CheckOffManager":
                                                    5,
                                                    created, 
                                                   )
-        check_off_manager.object_list.append(test_check_off)
-    check_off_manager._save_list(check_off_manager.object_list)
+        check_offs.append(test_check_off)
+    check_off_manager._save_list(check_offs)
+    check_off_manager.make_list("Daily habit title")
     return check_off_manager   
 
 
@@ -227,9 +242,9 @@ def test_delete_habit(monkeypatch: pytest.MonkeyPatch,
     inputs = iter(["1", "YES"])
     monkeypatch.setattr('builtins.input', lambda _: next(inputs))
     habit_instance.delete_habit(check_off_instance)
-    assert habit_instance.object_list == [rest_habit]
+    assert habit_instance.object_list == (rest_habit,)
     check_off_instance.make_list("Daily habit title")
-    assert check_off_instance.object_list == [] 
+    assert check_off_instance.object_list == ()
     
     #cleaning 
     os.remove("test_habit_data.json")
@@ -306,7 +321,7 @@ def test_delete_check_off(monkeypatch: pytest.MonkeyPatch,
     monkeypatch.setattr('builtins.input', lambda _: 2)
     check_off_instance.delete_check_off(chosen_habit, 5)
     check_off_instance.make_list(chosen_habit.title)
-    assert check_off_instance.object_list == [rest_check_off]
+    assert check_off_instance.object_list == (rest_check_off,)
     
     #cleaning 
     os.remove("test_habit_data.json")
@@ -344,3 +359,655 @@ def test_streak(test_habit: str,
     habit_manager.make_list()
     habit = [x for x in habit_manager.object_list if x.title == test_habit]
     assert main.streak(*habit, check_off_manager, 5, today) == expected                 
+
+
+def test_streak_series(today: date) -> None:
+    ''' Testing streak_series function from analytics module: every day of the series should
+        be equal to streak function called with that day as today.
+    '''
+    habit_manager = tracker_classes.HabitManager("habit_data_test.json", today)
+    check_off_manager = tracker_classes.CheckOffManager("check_off_test.json", today)
+    groups = analytics.group_check_offs(check_off_manager)
+    start = date(2024, 2, 1)
+    for habit in habit_manager.make_gen():
+        series = list(analytics.streak_series(habit, groups.get(habit.title, []), 5, start, today))
+        assert len(series) == (today - start).days + 1
+        for row in series[::4] + series[-1:]:
+            assert row[1:] == main.streak(habit, check_off_manager, 5, row[0])
+
+
+def test_export_history(today: date) -> None:
+    ''' Testing export of statistics history to CSV and JSON files. '''
+    habit_manager = tracker_classes.HabitManager("habit_data_test.json", today)
+    check_off_manager = tracker_classes.CheckOffManager("check_off_test.json", today)
+    groups = analytics.group_check_offs(check_off_manager)
+    for file_name in ("test_history.csv", "test_history.json"):
+        rows = analytics.history_table(habit_manager.make_gen(), groups, 5, today)
+        analytics.export_history(rows, file_name)
+    with open("test_history.csv", encoding="UTF-8") as file:
+        lines = file.read().splitlines()
+    assert lines[0] == ",".join(analytics.HISTORY_HEADER)
+    assert lines[-1] == "Not started habit,2024-02-26,11,Not started,0,0,0,N/D,N/D"
+    with open("test_history.json", encoding="UTF-8") as file:
+        records = tracker_classes.json.load(file)
+    assert len(records) == len(lines) - 1
+    assert records[0] == {"Habit": "Evening meditation", "Date": "2024-02-01", "Tenure": 0,
+                          "Status": "Not started", "Streak": 0, "Hiatus": 0, "Max streak": 0,
+                          "Aver emo": "N/D", "Emo trend": "N/D"}
+
+    #cleaning
+    os.remove("test_history.csv")
+    os.remove("test_history.json")
+
+
+def test_correlations(today: date) -> None:
+    ''' Testing habit correlation matrices from analytics module against direct calculation. '''
+    check_off_manager = tracker_classes.CheckOffManager("check_off_test.json", today)
+    titles = ["Morning meditation", "Evening meditation", "Morning run", "Not started habit"]
+    done, emotions = analytics.completion_matrix(check_off_manager, titles, date(2024, 2, 1), today)
+    assert done.shape == (4, 26)
+    assert done.sum() == 17
+    together, conditional, emotion_corr = analytics.correlations(done, emotions)
+    # Morning meditation and Morning run are both done on 02-10 and 02-25 only
+    assert conditional[0, 2] == pytest.approx(2 / 5)
+    assert conditional[2, 0] == pytest.approx(2 / 7)
+    assert together[0, 2] == pytest.approx(2 / 10)
+    # Evening meditation and Morning run: 02-14, 02-15 with emotions (3, 4) and (3, 5)
+    assert emotion_corr[1, 2] == pytest.approx(1.0)
+    assert emotion_corr[1, 2] == emotion_corr[2, 1]
+    assert np.isnan(conditional[3, 0]) and np.isnan(emotion_corr[0, 1])
+    rows = analytics.correlation_table(titles, together, conditional, emotion_corr, 2)
+    assert rows == [["Morning meditation", "Morning run", 20.0, 40.0, "N/D"],
+                    ["Evening meditation", "Morning run", 20.0, 40.0, 1.0]]
+
+
+def test_export(today: date) -> None:
+    ''' Testing export of habits and check-offs to JSON Lines and CSV files with filters. '''
+    habit_manager = tracker_classes.HabitManager("habit_data_test.json", today)
+    check_off_manager = tracker_classes.CheckOffManager("check_off_test.json", today)
+    assert export.export("habits", "test_export.csv", habit_manager, check_off_manager,
+                         archived=False) == 6
+    with open("test_export.csv", encoding="UTF-8") as file:
+        assert file.readline().strip() == ",".join(export.HABIT_FIELDS)
+        assert file.readline().startswith("Evening meditation,Meditate 15min before sleep,Daily")
+    
+    number = export.export("check_offs", "test_export.jsonl", habit_manager, check_off_manager,
+                           titles=["Morning run", "Evening yoga"], start=date(2024, 2, 2),
+                           end=date(2024, 2, 22), join=True)
+    assert number == 5
+    with open("test_export.jsonl", encoding="UTF-8") as file:
+        records = [tracker_classes.json.loads(line) for line in file]
+    assert records[0] == {"habit_title": "Morning run", "emotion": 1, "created": "2024-02-10",
+                          "periodicity": "Daily", "habit_created": "2024-02-01",
+                          "descr_update": "2024-02-08", "active": True}
+    assert records[-1]["habit_title"] == "Evening yoga"
+    
+    #cleaning
+    os.remove("test_export.csv")
+    os.remove("test_export.jsonl")
+
+
+def test_archive_history(monkeypatch: pytest.MonkeyPatch,
+                         habit_instance: "Habit",
+                         check_off_instance: "CheckOff"
+                        ) -> None:
+    ''' Testing moving check-off history of archived habit to cold segment and back. '''
+    history = list(check_off_instance.make_gen())
+    monkeypatch.setattr('builtins.input', lambda _: "1")
+    habit_instance.archive_habit(check_off_instance)
+    assert [x.habit_title for x in check_off_instance.make_gen()] == ["Weekly habit title"] * 2
+    assert os.path.exists("test_check_off_archive/Daily%20habit%20title.json.gz")
+    check_off_instance.make_list("Daily habit title")
+    assert check_off_instance.object_list == tuple(history[:2])
+    assert list(check_off_instance.cold_gen()) == history[:2]
+    
+    # unarchiving merges history back by date
+    habit_instance.unarchive_habit(check_off_instance)
+    habit_instance.make_list()
+    assert len(habit_instance.object_list) == 2
+    assert list(check_off_instance.make_gen()) == sorted(history, key=lambda x: x.created)
+    assert not os.listdir("test_check_off_archive")
+    
+    #cleaning 
+    os.rmdir("test_check_off_archive")
+    os.remove("test_habit_data.json")
+    os.remove("test_check_off.json")
+
+
+def test_partitioned_check_offs(monkeypatch: pytest.MonkeyPatch,
+                                habit_instance: "Habit",
+                                today: date
+                               ) -> None:
+    ''' Testing check-offs stored in monthly segments with a manifest. '''
+    with open("check_off_test.json", encoding="UTF-8") as source:
+        with open("test_check_off.json", "w", encoding="UTF-8") as file:
+            file.write(source.read().replace("2024-02-0", "2024-01-0"))
+    single = tracker_classes.CheckOffManager("test_check_off.json", today)
+    history = list(single.make_gen())
+    # existing file is split into segments
+    manager = tracker_classes.CheckOffManager("test_check_off.json", today, "month")
+    assert not os.path.exists("test_check_off.json")
+    assert list(manager.make_gen()) == sorted(history, key=lambda x: x.created.month)
+    manifest = manager._manifest()
+    assert list(manifest) == ["2024-01", "2024-02"]
+    assert manifest["2024-01"]["count"] == 3
+    assert manifest["2024-01"]["habits"] == {"Morning meditation": 1, "Sweaming in pool": 1, "Evening yoga": 1}
+    
+    manager.make_list("Morning run", 3)
+    assert [x.emotion for x in manager.object_list] == [3, 4, 3]
+    
+    # new check-off goes to its segment, delete rewrites only this segment
+    daily = tracker_classes.Habit("Morning run", "", "Daily", today, today)
+    monkeypatch.setattr('builtins.input', lambda _: 0)
+    manager.today = date(2024, 3, 1)
+    manager.report_check_off(daily, 5)
+    assert manager._manifest()["2024-03"]["count"] == 1
+    monkeypatch.setattr('builtins.input', lambda _: 5)
+    manager.delete_check_off(daily, 5)
+    assert "2024-03" not in manager._manifest()
+    assert not os.path.exists("test_check_off.2024-03.json")
+    
+    manager.delete_history("Morning meditation")
+    assert "Morning meditation" not in manager._manifest()["2024-01"]["habits"]
+    assert len(list(manager.make_gen())) == len(history) - 5
+    
+    # partition is taken from the manifest, another one is an error
+    assert tracker_classes.CheckOffManager("test_check_off.json", today).partition == "month"
+    assert len(list(tracker_classes.CheckOffManager("test_check_off.json", today).make_gen())) == len(history) - 5
+    with pytest.raises(ValueError):
+        tracker_classes.CheckOffManager("test_check_off.json", today, "year")
+    
+    # failed rewrite leaves no temporary segments, rewrite of a missing segment drops it
+    def failing() -> Iterator[Any]:
+        yield tracker_classes.CheckOff("Morning run", 3, date(2023, 12, 1))
+        raise RuntimeError("source failed")
+    with pytest.raises(RuntimeError):
+        manager._save_list(failing())
+    assert not [name for name in os.listdir(".") if name.endswith(".json.tmp")]
+    os.remove("test_check_off.2024-01.json")
+    manager._rewrite(["2024-01"], lambda elem: True)
+    assert list(manager._manifest()) == ["2024-02"]
+    
+    #cleaning
+    for name in ("test_check_off.2024-02.json", "test_check_off.manifest.json", "test_habit_data.json"):
+        os.remove(name)
+
+
+@pytest.mark.parametrize("partition", [None, "year"])
+def test_buffered_check_offs(partition: Any, today: date) -> None:
+    ''' Testing write-behind buffer of CheckOffManager: pending check-offs are seen by reads
+        and saved together by size, by flush and before rewrites.
+    '''
+    manager = tracker_classes.CheckOffManager("test_check_off.json", today, partition, buffer_size=3,
+                                              flush_interval=3600)
+    check_offs = [tracker_classes.CheckOff("Daily habit title", emotion, today + timedelta(days=emotion))
+                  for emotion in range(5)]
+    for check_off in check_offs[:2]: manager._append(check_off)
+    assert not os.path.exists("test_check_off.json") and not os.path.exists("test_check_off.2024.json")
+    manager.make_list("Daily habit title", 5)
+    assert manager.object_list == tuple(check_offs[:2])
+    manager._append(check_offs[2])                   # buffer is full
+    assert manager.pending == []
+    assert list(tracker_classes.CheckOffManager("test_check_off.json", today, partition).make_gen()) \
+        == check_offs[:3]
+    manager._append(check_offs[3])
+    manager._delete(check_offs[0])                   # rewrite saves pending check-offs first
+    assert list(manager.make_gen()) == check_offs[1:4]
+    manager._append(check_offs[4])
+    manager.flush()
+    assert list(tracker_classes.CheckOffManager("test_check_off.json", today, partition).make_gen()) \
+        == check_offs[1:]
+    
+    # pending check-off is saved flush_interval after it came, not after the last save, by a timer
+    manager.flush_interval = 0.5
+    time.sleep(0.6)
+    check_off = tracker_classes.CheckOff("Daily habit title", 5, today + timedelta(days=5))
+    manager._append(check_off)
+    assert manager.pending == [check_off]
+    for _ in range(100):
+        if not manager.pending: break
+        time.sleep(0.05)
+    assert list(tracker_classes.CheckOffManager("test_check_off.json", today, partition).make_gen()) \
+        == check_offs[1:] + [check_off]
+    
+    #cleaning
+    for name in ("test_check_off.json", "test_check_off.2024.json", "test_check_off.manifest.json"):
+        if os.path.exists(name): os.remove(name)
+
+
+def test_serialize(today: date) -> None:
+    ''' Testing methods generated by serialize decorator: JSON text should be byte-for-byte
+        the same as simplejson gives for the dict of fields.
+    '''
+    habit = tracker_classes.Habit('Title "with" quotes', "Описание\\", "Weekly", today, today, False)
+    assert habit._serialize() == {"title": 'Title "with" quotes', "description": "Описание\\",  # type: ignore[attr-defined]
+                                  "periodicity": "Weekly", "created": "2024-02-26",
+                                  "descr_update": "2024-02-26", "active": False}
+    assert habit._encode() == tracker_classes.json.dumps(habit._serialize())  # type: ignore[attr-defined]
+    assert habit._values() == ('Title "with" quotes', "Описание\\", "Weekly", today, today, False)  # type: ignore[attr-defined]
+    
+    check_off_manager = tracker_classes.CheckOffManager("check_off_test.json", today)
+    check_offs = list(check_off_manager.make_gen())
+    check_off_manager.file_name = "test_check_off.json"
+    for source, expected in (([], []), (check_offs, check_offs), (iter(check_offs), check_offs)):
+        check_off_manager._save_list(source)
+        with open("test_check_off.json", encoding="UTF-8") as file:
+            assert file.read() == tracker_classes.json.dumps([x._serialize() for x in expected])
+    
+    #cleaning
+    os.remove("test_check_off.json")
+
+
+def test_replay_session(tmp_path: Any, today: date) -> None:
+    ''' Testing replay harness: scripted session through main menus on generated history. '''
+    folder = str(tmp_path)
+    benchmark.generate_history(os.path.join(folder, "habit_data.json"),
+                               os.path.join(folder, "check_off.json"), 4, 30, today - timedelta(days=1))
+    session = replay.Replay(folder, today)
+    replay.session(session, 8)
+    report = session.report()
+    assert {"add habit", "report", "dashboard active", "dashboard archived",
+            "dashboard correlation"} <= set(report)
+    assert report["add habit"]["count"] == 3
+    assert report["report"]["p50_ms"] <= report["report"]["p99_ms"]
+    assert report["dashboard active"]["files"] == {"check_off.json": 1, "habit_data.json": 1,   # hashed
+                                                   "check_off.json.cache.npz": 1, "habit_data.json.cache.npz": 1}
+    session.check_off_manager.make_list("Replay habit 0")
+    assert 0 < len(session.check_off_manager.object_list) <= 8
+
+
+# Memory budgets: streaming operations should not depend on the size of history, so the same
+# ceiling is used for small and big files. Batches are made smaller, so both sizes are bigger
+# than one batch and tests run fast under tracemalloc.
+STREAMING_CEILING = 2_500_000       # bytes, 1 MB of it is the write buffer of the output file
+DASHBOARD_BYTES_PER_RECORD = 300    # dashboard keeps all check-offs grouped by habit in memory
+
+
+@pytest.fixture(scope="module")
+def histories(tmp_path_factory: pytest.TempPathFactory) -> dict[int, tuple[Any, Any]]:
+    ''' Two generated histories: about 2k and 10k check-offs. '''
+    folder = tmp_path_factory.mktemp("memory")
+    result = {}
+    for habits_number, days in ((10, 250), (20, 650)):
+        result[habits_number] = benchmark.generate_history(str(folder / f"habit_{habits_number}.json"),
+                                                           str(folder / f"check_off_{habits_number}.json"),
+                                                           habits_number, days, date(2024, 2, 26))
+    return result
+
+
+def peak_memory(function: Any) -> int:
+    ''' Runs function under tracemalloc and returns peak memory in bytes. '''
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def peak_report(function: Any, peak: int) -> str:
+    ''' Runs function again to find where the memory goes: a watcher thread keeps the snapshot
+        taken at the highest traced memory. Used for messages of failed memory tests.
+    '''
+    best: list[Any] = [0, None]
+    done = threading.Event()
+    def watch() -> None:
+        while not done.is_set():
+            current = tracemalloc.get_traced_memory()[0]
+            if current > best[0]: best[:] = [current, tracemalloc.take_snapshot()]
+            time.sleep(0.001)
+    tracemalloc.start(10)
+    watcher = threading.Thread(target=watch)
+    watcher.start()
+    try:
+        function()
+    finally:
+        done.set()
+        watcher.join()
+        tracemalloc.stop()
+    sites = "" if best[1] is None else "\n".join(
+        str(stat) for stat in best[1].filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+                                     .statistics("lineno")[:10])
+    return f"peak {peak} bytes, top allocation sites near the peak:\n{sites}"
+
+
+@pytest.mark.parametrize("operation", ["load", "save generator", "delete habit history",
+                                       "delete check-off", "export"])
+def test_streaming_memory(operation: str, 
+                          histories: dict[int, tuple[Any, Any]],
+                          monkeypatch: pytest.MonkeyPatch,
+                          tmp_path: Any
+                         ) -> None:
+    ''' Peak memory of streaming operations stays under the same ceiling for small and big history. '''
+    monkeypatch.setattr(tracker_classes, "SAVE_BATCH", 500)
+    monkeypatch.setattr(tracker_classes, "READ_CHUNK", 1 << 14)
+    monkeypatch.setattr(export, "EXPORT_BATCH", 500)
+    peaks = []
+    for habit_manager, check_off_manager in histories.values():
+        first = next(iter(check_off_manager.make_gen()))
+        function = {"load": lambda: sum(1 for _ in check_off_manager.make_gen()),
+                    "save generator": lambda: check_off_manager._save_list(check_off_manager.make_gen()),
+                    "delete habit history": lambda: check_off_manager.delete_history("Habit 00001"),
+                    "delete check-off": lambda: check_off_manager._delete(first),
+                    "export": lambda: export.export("check_offs", str(tmp_path / "export.jsonl"),
+                                                    habit_manager, check_off_manager, join=True)
+                   }[operation]
+        peak = peak_memory(function)
+        assert peak < STREAMING_CEILING, peak_report(function, peak)
+        peaks.append(peak)
+    # ten times more data may not cost more than a fraction of the small one
+    assert peaks[1] < peaks[0] * 1.5 + 100_000, f"peaks {peaks} grow with history size"
+
+
+def test_dashboard_memory(histories: dict[int, tuple[Any, Any]], today: date) -> None:
+    ''' Dashboard reads the whole history grouped by habit, its memory is limited per check-off. '''
+    for habit_manager, check_off_manager in histories.values():
+        records = sum(1 for _ in check_off_manager.make_gen())
+        habits = list(habit_manager.make_gen())
+        function = lambda: analytics.dashboard_stats(habits, analytics.group_check_offs(check_off_manager),
+                                                     5, today)
+        peak = peak_memory(function)
+        assert peak < records * DASHBOARD_BYTES_PER_RECORD + 500_000, peak_report(function, peak)
+
+
+def test_emotion_profile(today: date) -> None:
+    ''' Testing emotion analytics of a habit and its cache. '''
+    check_off_manager = tracker_classes.CheckOffManager("check_off_test.json", today)
+    groups = analytics.group_check_offs(check_off_manager)
+    profile = analytics.emotion_profile(groups["Morning run"], today, windows=(3, 7), alpha=0.5)
+    assert list(profile["rolling"][3]) == [1.0, 3.0, 4.0, 2.0, 2.5, 3.0, 10 / 3]
+    assert profile["window"] == {3: 3.5, 7: 3.0}
+    # weights 1/64 ... 1/2, 1 for emotions 1, 3, 5, 2, 3, 4, 3
+    assert profile["ewma"] == pytest.approx((1 + 6 + 20 + 16 + 48 + 128 + 192) / 127)
+    assert profile["weekdays"][3] == 3.5                      # two Thursdays: 3 and 4
+    assert np.isnan(profile["weekdays"][0])                   # no Mondays
+    assert profile["slope"] > 0 and profile["p_value"] > 0.05
+    # three check-offs leave one degree of freedom: t = 3.5 is not significant
+    few = [tracker_classes.CheckOff("Few", emotion, today - timedelta(days=2 - day)) for day, emotion in enumerate((0, 1, 3))]
+    assert analytics.emotion_profile(few, today)["p_value"] == pytest.approx(0.121, abs=1e-3)
+    assert analytics._t_p_value(2.0, 10) == pytest.approx(0.0734, abs=1e-4)
+    
+    # "Evening meditation" emotions go down: 3, 4, 2, 1, 0, but five of them are too few (p = 0.066)
+    down = [tracker_classes.CheckOff("Down", 5 - day // 2, today - timedelta(days=9 - day)) for day in range(10)]
+    rows = analytics.emotion_table(["Evening meditation", "Down", "Not started habit"],
+                                   [analytics.emotion_profile(groups["Evening meditation"], today),
+                                    analytics.emotion_profile(down, today),
+                                    analytics.emotion_profile([], today)])
+    assert rows[0][-2] == "Flat" and rows[1][-2] == "Down"
+    assert rows[2] == ["Not started habit"] + ["N/D"] * 8
+    
+    # cache is used until a new check-off of the habit
+    check_off_manager = tracker_classes.CheckOffManager("test_check_off.json", today)
+    check_off_manager._save_list(groups["Morning run"])
+    cache = analytics.EmotionCache(check_off_manager)
+    first = cache.profiles_for(["Morning run"])[0]
+    assert cache.profiles_for(["Morning run"])[0] is first
+    check_off_manager._append(tracker_classes.CheckOff("Morning run", 5, today))
+    second = cache.profiles_for(["Morning run"])[0]
+    assert second is not first and second["window"][7] == pytest.approx(17 / 5)
+    assert cache.profiles_for(["Morning run"])[0] is second
+    other = tracker_classes.CheckOffManager("test_check_off.json", today)    # e.g. another process
+    other._append(tracker_classes.CheckOff("Morning run", 0, today))
+    assert cache.profiles_for(["Morning run"])[0]["window"][7] == pytest.approx(17 / 6)
+    
+    #cleaning
+    os.remove("test_check_off.json")
+
+
+def _append_check_offs(file_name: str, today: date, number: int) -> None:
+    # writer process for test_concurrent_access
+    manager = tracker_classes.CheckOffManager(file_name, today)
+    for day in range(number):
+        manager._append(tracker_classes.CheckOff("Writer habit", day % 6, today + timedelta(days=day)))
+
+
+def test_concurrent_access(tmp_path: Any, today: date) -> None:
+    ''' Testing locks of managers: readers in threads and in this process never see a file
+        half-written by writer threads or another process.
+    '''
+    lock = tracker_classes.RWLock()
+    with lock.writing(), lock.reading(), lock.writing():     # writer can read and write again
+        pass
+    with lock.reading(), pytest.raises(RuntimeError):
+        with lock.writing(): pass
+    def reader() -> Generator[None, None, None]:
+        with lock.reading(): yield
+    first, second, third = reader(), reader(), reader()
+    for generator in (first, second, third): next(generator)
+    first.close()                               # readers end out of order, the lock is still held
+    assert lock._readers == 1
+    third.close(); second.close()
+    assert lock._readers == 0 and lock._local.reads == 0
+    with lock.writing(): pass
+    
+    file_name = os.path.join(str(tmp_path), "check_off.json")
+    history = [tracker_classes.CheckOff(f"Habit {index % 3}", 3, today - timedelta(days=index // 3))
+               for index in range(300, 0, -1)]
+    manager = tracker_classes.CheckOffManager(file_name, today)
+    manager._save_list(history)
+    errors: list[Exception] = []
+    sizes: set[int] = set()
+    def read() -> None:
+        try:
+            for _ in range(20):
+                sizes.add(len(list(manager.make_gen())))
+                assert manager.snapshot("Habit 0") == tuple(x for x in history if x.habit_title == "Habit 0")
+        except Exception as error:
+            errors.append(error)
+    def write() -> None:
+        try:
+            for day in range(1, 21):
+                check_off = tracker_classes.CheckOff("Habit 9", 1, today + timedelta(days=day))
+                manager._append(check_off)
+                if day % 2: manager._delete(check_off)
+        except Exception as error:
+            errors.append(error)
+    threads = [threading.Thread(target=read) for _ in range(3)] + [threading.Thread(target=write)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert errors == [] and sizes <= set(range(300, 311))
+    assert len(list(manager.make_gen())) == 310
+    
+    if tracker_classes.fcntl is None: return      # no locks between processes
+    process = multiprocessing.get_context("fork").Process(target=_append_check_offs,
+                                                          args=(file_name, today, 300))
+    process.start()
+    while process.is_alive():
+        assert len(list(manager.make_gen())) in range(310, 611)
+    process.join()
+    assert process.exitcode == 0 and len(list(manager.make_gen())) == 610
+
+
+@pytest.mark.parametrize("partition", [None, "year"])
+def test_fsck(tmp_path: Any, partition: Any, today: date) -> None:
+    ''' Testing integrity check and repair: violations are found with their location and 
+        repair leaves data without them.
+    '''
+    folder = str(tmp_path)
+    habit_manager, check_off_manager = benchmark.generate_history(
+        os.path.join(folder, "habit_data.json"), os.path.join(folder, "check_off.json"), 3, 20, today)
+    if partition:
+        check_off_manager = tracker_classes.CheckOffManager(check_off_manager.file_name, today, partition)
+    good = list(check_off_manager.make_gen())
+    check_off_manager.archive_history("Habit 00000")        # active habit with its history in cold segment
+    bad = [tracker_classes.CheckOff("Ghost", 3, today),                         # orphan
+           tracker_classes.CheckOff("Habit 00001", 4, today - timedelta(days=30)),   # out of order
+           tracker_classes.CheckOff("Habit 00001", 2, today),
+           tracker_classes.CheckOff("Habit 00001", 1, today)]                   # duplicate
+    for check_off in bad: check_off_manager._append(check_off)
+    file_name = check_off_manager._segment_name("2024") if partition else check_off_manager.file_name
+    with open(file_name, encoding="UTF-8") as file:
+        text = file.read()
+    with open(file_name, "w", encoding="UTF-8") as file:      # invalid emotion, cut off "]"
+        file.write(text[:-1] + ', {"habit_title": "Habit 00002", "emotion": 9, "created": "2024-02-26"}')
+    hot = [x for x in good if x.habit_title != "Habit 00000"]
+    number = len(hot) - (sum(x.created.year < 2024 for x in hot) if partition else 0)
+    name = os.path.basename(file_name)
+    violations = list(fsck.check(habit_manager, check_off_manager))
+    assert [kind for kind, _, _ in violations] == \
+        ["orphan", "order", "duplicate", "invalid", "damaged", "cold"]
+    assert violations[0][1] == f"{name}, record {number + 1}"
+    assert violations[4][1] == f"{name}, after record {number + 5}"
+    
+    dropped = fsck.repair(habit_manager, check_off_manager, run_size=2)
+    assert dropped == {"orphan check-off": 1, "duplicate check-off": 1, "invalid check-off": 1}
+    assert list(fsck.check(habit_manager, check_off_manager)) == []
+    assert sorted(check_off_manager.make_gen(), key=lambda x: (x.created, x.habit_title)) == \
+           sorted(good + bad[1:3], key=lambda x: (x.created, x.habit_title))
+    assert check_off_manager._cold_name("Habit 00000") is None
+
+
+def test_completion_rates(today: date) -> None:
+    ''' Testing completion rates over windows and since the description update, and goal. '''
+    daily = tracker_classes.Habit("Reading", "Daily habit", "Daily", date(2024, 2, 1), date(2024, 2, 20))
+    check_offs = [tracker_classes.CheckOff("Reading", 3, date(2024, 2, day)) for day in (1, 10, 15, 20, 22, 24, 25, 26)]
+    rates = analytics.completion_rates(daily, check_offs, today)
+    assert rates == (71.4, 30.8, 30.8, 30.8, 71.4)      # 5 of 7 days, 8 of 26 days since created
+    # today is not over yet, so windows start yesterday, but not before the update
+    assert analytics.completion_rates(daily, check_offs[:-1], today, (7,)) == (57.1, 66.7)
+    every_day = [tracker_classes.CheckOff("Reading", 3, date(2024, 2, day)) for day in range(20, 26)]
+    assert analytics.completion_rates(daily, every_day, today, (7,)) == (85.7, 100.0)
+    assert analytics.goal_stats(daily, rates[-1], {"Daily": 80.0}) == (80.0, "Behind")
+    assert analytics.goal_stats(daily, rates[-1], {"Daily": 80.0, "Reading": 70.0}) == (70.0, "Met")
+    
+    weekly = tracker_classes.Habit("Weekly", "Weekly habit", "Weekly", date(2024, 1, 1), date(2024, 1, 1))
+    check_offs = [tracker_classes.CheckOff("Weekly", 3, created) 
+                  for created in (date(2024, 1, 30), date(2024, 2, 14), date(2024, 2, 24))]
+    assert analytics.completion_rates(weekly, check_offs, today) == (100.0, 75.0, 33.3, 33.3, 33.3)
+    stats = analytics.dashboard_stats([daily, weekly], {"Weekly": check_offs}, 5, today, 
+                                      windows=(7,), targets={"Weekly": 90.0})
+    assert stats[0][-4:] == (0.0, 0.0, "N/D", "N/D") and stats[1][-4:] == (100.0, 33.3, 90.0, "Behind")
+
+
+def test_dashboard_stats(today: date) -> None:
+    ''' Testing dashboard statistics: rows are in the order of habits, the same as habit_stats
+        and completion_rates give for every habit.
+    '''
+    habits = benchmark.make_habits(12, today, 60)
+    groups: dict[str, list[Any]] = {}
+    for check_off in benchmark.make_check_offs(habits, today, 60):
+        groups.setdefault(check_off.habit_title, []).append(check_off)
+    stats = analytics.dashboard_stats(habits, groups, 5, today, windows=(7, 30), targets={"Daily": 80.0})
+    for habit, row in zip(habits, stats, strict=True):
+        rates = analytics.completion_rates(habit, groups[habit.title], today, (7, 30))
+        assert row == (*analytics.habit_stats(habit, groups[habit.title], 5, today), *rates,
+                       *analytics.goal_stats(habit, rates[-1], {"Daily": 80.0}))
+
+
+def test_periodicity(today: date) -> None:
+    ''' Testing periodicity rules, calendar periods of streak statistics and completion rates. '''
+    Period, parse = periodicity.Period, periodicity.periodicity
+    assert parse("Daily") == Period("rolling", 1) and parse("Weekly") == Period("rolling", 7)
+    assert parse("every 10 days") == Period("days", 10) and parse("3 per 10 days") == Period("days", 10, 3)
+    assert parse("2 per month") == Period("month", 30, 2) and parse("ISO weekly") == Period("week", 7)
+    for text in ("Every 0 days", "0 per week", "Fortnightly"):
+        with pytest.raises(ValueError): parse(text)
+    ordinals = np.array([date(2024, 1, 31).toordinal(), date(2024, 2, 1).toordinal(), today.toordinal()])
+    assert parse("Monthly").index(ordinals, 0).tolist() == [648, 649, 649]
+    assert np.diff(parse("ISO weekly").index(ordinals, 0)).tolist() == [0, 4]     # Thu, Thu, Mon
+    
+    def series(text: str, created: date, days: list[date], start: date, end: date = today) -> list[Any]:
+        habit = tracker_classes.Habit("Title", "Description", text, created, created)
+        check_offs = [tracker_classes.CheckOff("Title", 3, day) for day in days]
+        return [row[1:6] for row in analytics.streak_series(habit, check_offs, 5, start, end)]
+    
+    # Monday and Sunday of the next week: two calendar weeks in a row, but 13 days apart
+    days = [date(2024, 1, 1), date(2024, 1, 14), date(2024, 1, 15), date(2024, 2, 19)]
+    assert series("Weekly", date(2024, 1, 1), days, date(2024, 1, 14), date(2024, 1, 14)) == [(1, "Streak", 1, 0, 1)]
+    assert series("ISO weekly", date(2024, 1, 1), days, date(2024, 1, 14), date(2024, 1, 14)) == [(1, "Streak", 2, 0, 2)]
+    assert series("ISO weekly", date(2024, 1, 1), days, date(2024, 2, 12), date(2024, 2, 12)) == [(6, "Broken", 0, 3, 3)]
+    assert series("ISO weekly", date(2024, 1, 1), days, today) == [(8, "Streak", 1, 0, 3)]
+    # 3 check-offs are needed every week: the week of Feb 19 is not done
+    days = [date(2024, 2, 12), date(2024, 2, 13), date(2024, 2, 14), date(2024, 2, 20)]
+    assert series("3 per week", date(2024, 2, 12), days, date(2024, 2, 21), date(2024, 2, 21)) == [(1, "Streak", 1, 0, 1)]
+    assert series("3 per week", date(2024, 2, 12), days, today) == [(2, "Broken", 0, 1, 1)]
+    assert series("3 per week", date(2024, 2, 19), days[3:], date(2024, 2, 20)) == \
+           [(0, "Not started", 0, 0, 0)] * 6 + [(1, "Broken", 0, 1, 0)]
+    
+    habit = tracker_classes.Habit("Title", "Description", "Every 3 days", date(2024, 2, 20), date(2024, 2, 20))
+    check_offs = [tracker_classes.CheckOff("Title", 3, day) for day in (date(2024, 2, 21), today)]
+    assert analytics.habit_stats(habit, check_offs, 5, today)[:5] == (2, "Streak", 1, 0, 1)
+    assert analytics.completion_rates(habit, check_offs, today, (3, 9)) == (100.0, 66.7, 66.7)
+    # tenure before the description update is counted from the creation
+    updated = tracker_classes.Habit("Title", "Description", "ISO weekly", date(2024, 1, 1), date(2024, 2, 12))
+    assert [row[1] for row in analytics.streak_series(updated, [], 5, date(2024, 2, 11), date(2024, 2, 12))] == [5, 0]
+
+
+@pytest.mark.parametrize("partition", [None, "year"])
+def test_cache(tmp_path: Any, monkeypatch: pytest.MonkeyPatch, partition: Any, today: date) -> None:
+    ''' Testing binary cache of data files: objects are the same as parsed from the file, the
+        cache is used without parsing, appended check-offs are added and rewrites are noticed.
+    '''
+    folder = str(tmp_path)
+    habit_manager, check_off_manager = benchmark.generate_history(
+        os.path.join(folder, "habit_data.json"), os.path.join(folder, "check_off.json"), 3, 400, today)
+    habits = habit_manager.snapshot(None)
+    cached = tracker_classes.CheckOffManager(check_off_manager.file_name, today, partition, cache=True)
+    check_offs = list(cached.make_gen())        # partitioned storage is made at the first start
+    assert list(cached.make_gen()) == check_offs
+    assert tracker_classes.HabitManager(habit_manager.file_name, today, cache=True).snapshot(None) == habits
+    
+    with monkeypatch.context() as patch:        # files are not parsed with the cache
+        patch.setattr(tracker_classes.ObjectManager, "_file_records", lambda *_: pytest.fail("parsed"))
+        assert list(tracker_classes.CheckOffManager(cached.file_name, today, partition, cache=True).make_gen()) \
+               == check_offs
+        assert tracker_classes.HabitManager(habit_manager.file_name, today, cache=True).snapshot(None) == habits
+        new = [tracker_classes.CheckOff("Habit 00001", 5, today), tracker_classes.CheckOff('New "habit"', 0, today)]
+        for check_off in new: cached._append(check_off)
+        assert list(cached.make_gen()) == check_offs + new        # only appended check-offs are parsed
+    
+    cached.delete_history("Habit 00001")
+    assert list(cached.make_gen()) == [x for x in check_offs + new if x.habit_title != "Habit 00001"]
+    habit_cache = tracker_classes.HabitManager(habit_manager.file_name, today, cache=True)
+    with open(habit_manager.file_name, "rb") as file: data = file.read()
+    with open(habit_manager.file_name, "wb") as file:  # same size rewrite (e.g. by hand) is noticed
+        file.write(data.replace(b"Habit 00002", b"Habit 0000X"))
+    assert sorted(habit.title for habit in habit_cache.snapshot(None)) == ["Habit 00000", "Habit 00001", "Habit 0000X"]
+    for name in os.listdir(folder):                     # damaged cache is not used
+        if name.endswith(".cache.npz"):
+            with open(os.path.join(folder, name), "wb") as file: file.write(b"damaged")
+    assert list(cached.make_gen()) == [x for x in check_offs + new if x.habit_title != "Habit 00001"]
+
+
+def test_scheduler(tmp_path: Any, monkeypatch: pytest.MonkeyPatch, today: date) -> None:
+    ''' Testing due habit scheduler: deadlines of all periodicities, queries and updates by new
+        check-offs without reading the history.
+    '''
+    Habit, CheckOff = tracker_classes.Habit, tracker_classes.CheckOff
+    start = date(2024, 2, 1)
+    habits = [Habit("Run", "", "Daily", start, start), Habit("Read", "", "Daily", start, start),
+              Habit("Swim", "", "Weekly", start, start), Habit("Yoga", "", "3 per week", start, start),
+              Habit("Clean", "", "Monthly", start, start), Habit("Call", "", "Daily", today, today)]
+    check_offs = [CheckOff("Yoga", 3, date(2024, 2, day)) for day in (19, 20, 21)] + \
+                 [CheckOff("Read", 3, date(2024, 2, 20)), CheckOff("Swim", 3, date(2024, 2, 22)), 
+                  CheckOff("Run", 3, date(2024, 2, 25))]
+    habit_manager = tracker_classes.HabitManager(os.path.join(str(tmp_path), "habit_data.json"), today)
+    check_off_manager = tracker_classes.CheckOffManager(os.path.join(str(tmp_path), "check_off.json"), today)
+    habit_manager._save_list(habits)
+    check_off_manager._save_list(sorted(check_offs, key=lambda x: x.created))
+    due = scheduler.DueScheduler(habit_manager, check_off_manager)
+    
+    def titles(entries: list[Any]) -> list[str]:
+        return [habit.title for habit, _ in entries]
+    
+    assert [(habit.title, day.day) for habit, day in due.ordered()] == \
+           [("Read", 21), ("Call", 26), ("Run", 26), ("Clean", 29), ("Swim", 29), ("Yoga", 3)]
+    assert titles(due.overdue()) == ["Read"] and titles(due.due_today()) == ["Call", "Run"]
+    assert titles(due.at_risk()) == ["Run"]         # "Call" has no streak yet
+    
+    with monkeypatch.context() as patch:            # new check-offs don't read the history
+        patch.setattr(check_off_manager, "make_gen", lambda *_: pytest.fail("history is read"))
+        patch.setattr(check_off_manager, "snapshot", lambda *_: pytest.fail("history is read"))
+        check_off_manager._append(CheckOff("Run", 4, today))
+        assert titles(due.due_today()) == ["Call"] and due.at_risk() == []
+        for _ in range(2): check_off_manager._append(CheckOff("Yoga", 4, today))
+        assert due.deadlines["Yoga"] == date(2024, 3, 3).toordinal()       # 2 of 3 this week
+        check_off_manager._append(CheckOff("Yoga", 4, today))
+        assert due.deadlines["Yoga"] == date(2024, 3, 10).toordinal()
+    
+    check_off_manager._delete(CheckOff("Run", 4, today))       # changed history is read again
+    habit_manager._save_list([habit for habit in habits if habit.title != "Clean"])
+    assert titles(due.due_today()) == ["Call", "Run"] and "Clean" not in titles(list(due.ordered()))
+    other = tracker_classes.CheckOffManager(check_off_manager.file_name, today)   # e.g. another process
+    other._append(CheckOff("Read", 3, today))
+    assert titles(due.overdue()) == [] and due.deadlines["Read"] == date(2024, 2, 27).toordinal()